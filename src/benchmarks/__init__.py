@@ -0,0 +1,9 @@
+"""Benchmarks for the simulation. They are run from the `src` folder, e.g.
+
+    python -m benchmarks.swarm_construction
+
+The hot paths are timed with `python -m benchmarks.hot_paths`. Its results
+can be kept as a baseline and given to a later run with `--baseline`, which
+then fails if a case got slower. The startup time of fresh processes is
+timed the same way with `python -m benchmarks.startup`.
+"""
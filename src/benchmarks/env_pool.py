@@ -0,0 +1,65 @@
+"""Measure the throughput (environment steps per second) of an `EnvPool` for
+different numbers of worker processes, against a single `Simulation`."""
+
+import os
+import time
+import argparse
+
+import numpy as np
+
+# Local imports
+from sim import Simulation
+from env_pool import EnvPool
+
+
+def measure_single(n_steps, sim_kwargs):
+    sim = Simulation(headless=True, **sim_kwargs)
+    rng = np.random.default_rng(0)
+
+    start = time.perf_counter()
+    for _ in range(n_steps):
+        _, _, done, _ = sim.step(int(rng.integers(0, 2)))
+
+        if done:
+            sim.reset()
+
+    return n_steps / (time.perf_counter() - start)
+
+
+def measure_pool(n_workers, n_steps, sim_kwargs):
+    rng = np.random.default_rng(0)
+
+    with EnvPool(n_workers, **sim_kwargs) as pool:
+        pool.reset()
+
+        start = time.perf_counter()
+        for _ in range(n_steps):
+            pool.step(rng.integers(0, 2, n_workers))
+
+        return n_steps * n_workers / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", 
+                        default=[1, 2, 4, 8])
+    parser.add_argument("--steps", type=int, default=200,
+                        help="The number of steps of every worker")
+    parser.add_argument("--sensor-backend", default="pixel")
+    args = parser.parse_args()
+
+    sim_kwargs = {"sensor_backend": args.sensor_backend}
+
+    print(f"CPU cores: {os.cpu_count()}")
+    print(f"{'workers':>8} {'steps/s':>10} {'speedup':>8}")
+
+    single = measure_single(args.steps, sim_kwargs)
+    print(f"{'single':>8} {single:>10.1f} {1:>8.2f}")
+
+    for n_workers in args.workers:
+        throughput = measure_pool(n_workers, args.steps, sim_kwargs)
+        print(f"{n_workers:>8} {throughput:>10.1f} {throughput / single:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+"""Time the hot paths of the simulation: the readings of the laser sensors, the
+evaluation of the fuzzy controller, every state of the swarm controller, the
+reset of the simulation and a whole step, with and without rendering.
+
+The results are written as JSON, with the percentiles of the duration of every
+case, and can be compared against a baseline written by an earlier run. The
+exit code is 1 if a case got slower than its baseline by more than the given
+tolerance."""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import itertools
+
+import numpy as np
+
+# Local imports
+import constants
+
+from sim import Simulation
+from swarm import SwarmState
+
+
+# The number of calls made before measuring
+WARMUP = 5
+
+PERCENTILES = (50, 90, 99)
+
+# The tolerance of the sensors that reuse their scans
+REUSE_TOLERANCE = (0.5, 0.005)
+
+
+def time_calls(func, repeat):
+    """Returns the durations (in seconds) of `repeat` calls of a function."""
+
+    for _ in range(WARMUP):
+        func()
+
+    times = np.empty(repeat)
+    for i in range(repeat):
+        start = time.perf_counter()
+        func()
+        times[i] = time.perf_counter() - start
+
+    return times
+
+
+def summarize(times):
+    """Returns the statistics of the durations of a case, in microseconds."""
+
+    times = np.asarray(times) * 1e6
+    stats = {"n": len(times), "mean_us": float(times.mean()), "max_us": float(times.max())}
+
+    for p in PERCENTILES:
+        stats[f"p{p}_us"] = float(np.percentile(times, p))
+
+    return stats
+
+
+def create_sim(swarm_size, n_rays, n_samples, sensor_params=None, **sim_kwargs):
+    sim_kwargs = {"headless": True, "seed": 0} | sim_kwargs
+    sim = Simulation(swarm_size=swarm_size,
+                     sensor_params={"n_readings": n_rays, "n_samples": n_samples} 
+                                   | (sensor_params or {}),
+                     **sim_kwargs)
+
+    # Take a step, so that the arena is drawn for the pixel sensors
+    sim.step(0)
+
+    return sim
+
+
+def bench_sensors(results, params, repeat):
+    for backend in ("pixel", "raycast"):
+        sim = create_sim(*params, sensor_backend=backend)
+        sensor = sim.swarm.robots[0].sensor
+
+        results[f"get_reading[{backend}]"] = summarize(time_calls(sensor.get_reading, repeat))
+
+        # The readings that reuse the last scan, and the ones that can not,
+        # which pay for checking the poses on top of the scan
+        sim = create_sim(*params, sensor_backend=backend, 
+                         sensor_params={"reuse_tolerance": REUSE_TOLERANCE})
+        sensor = sim.swarm.robots[0].sensor
+        results[f"get_reading[{backend},reuse-hit]"] = summarize(time_calls(sensor.get_reading, repeat))
+
+        x, y = sensor.position
+        offsets = itertools.cycle((0, 1))
+
+        def moved_reading():
+            sensor.update_position((x + next(offsets), y), sensor.sensor_angle)
+            sensor.get_reading()
+
+        results[f"get_reading[{backend},reuse-miss]"] = summarize(time_calls(moved_reading, repeat))
+
+
+def bench_flc(results, params, repeat):
+    sim = create_sim(*params, sensor_backend="raycast")
+    inputs = sim.swarm.get_flc_inputs()
+
+    results["flc.evaluate"] = summarize(time_calls(lambda: sim.flc.evaluate(*inputs[0]), repeat))
+    results["flc.evaluate_batch"] = summarize(
+            time_calls(lambda: sim.flc.evaluate_batch(*inputs.T), repeat))
+
+
+def bench_swarm_states(results, params, repeat):
+    """Time every call of `SwarmController.run`, grouped by the state the swarm
+    was in before the call."""
+
+    sim = create_sim(*params, sensor_backend="raycast")
+    rng = np.random.default_rng(0)
+    times = {state: [] for state in SwarmState}
+
+    while min(len(t) for t in times.values()) < repeat:
+        action = int(rng.integers(0, 2))
+
+        start = time.perf_counter()
+        sim.swarm.run(action)
+        times[SwarmState.NONE].append(time.perf_counter() - start)
+
+        while sim.swarm.state != SwarmState.NONE:
+            state = sim.swarm.state
+
+            start = time.perf_counter()
+            sim.swarm.run()
+            times[state].append(time.perf_counter() - start)
+
+            sim.space.step(1/constants.FPS)
+
+        # Restart the episode if the swarm carried the target away
+        if len(times[SwarmState.NONE]) % constants.MAX_EP_STEPS == 0:
+            sim.reset()
+
+    for state, state_times in times.items():
+        results[f"swarm.run[{state.name}]"] = summarize(state_times)
+
+
+def bench_sim(results, params, repeat):
+    sim = create_sim(*params, sensor_backend="raycast")
+    results["sim.reset"] = summarize(time_calls(sim.reset, repeat))
+
+    for name, sim_kwargs in (("headless", {"headless": True}),
+                             ("render", {"headless": False, "frame_rate": None})):
+        sim = create_sim(*params, **sim_kwargs)
+        rng = np.random.default_rng(0)
+
+        def step():
+            _, _, done, _ = sim.step(int(rng.integers(0, 2)))
+
+            if done:
+                sim.reset()
+
+        results[f"sim.step[{name}]"] = summarize(time_calls(step, repeat))
+
+
+BENCHMARKS = {
+    "sensors": bench_sensors,
+    "flc": bench_flc,
+    "swarm": bench_swarm_states,
+    "sim": bench_sim,
+}
+
+
+def run(args):
+    """Returns the results of all of the cases, keyed by their name and their
+    parameters."""
+
+    results = {}
+
+    for params in itertools.product(args.swarm_sizes, args.rays, args.samples):
+        for name in args.only or BENCHMARKS:
+            case_results = {}
+            BENCHMARKS[name](case_results, params, args.repeat)
+
+            for case, stats in case_results.items():
+                key = f"{case}(robots={params[0]},rays={params[1]},samples={params[2]})"
+                results[key] = stats
+                print(f"{key:<60} p50 {stats['p50_us']:>10.1f} us   "
+                      f"p99 {stats['p99_us']:>10.1f} us")
+
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Returns the cases whose median got slower than in the baseline by more
+    than the tolerance."""
+
+    regressions = []
+
+    for case, stats in results.items():
+        if case not in baseline:
+            continue
+
+        ratio = stats["p50_us"] / baseline[case]["p50_us"]
+        if ratio > 1 + tolerance:
+            regressions.append((case, ratio))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--swarm-sizes", type=int, nargs="+", default=[3])
+    parser.add_argument("--rays", type=int, nargs="+", default=[32],
+                        help="The number of rays of every laser sensor")
+    parser.add_argument("--samples", type=int, nargs="+", default=[150],
+                        help="The number of samples along every ray (pixel backend)")
+    parser.add_argument("--repeat", type=int, default=100,
+                        help="The number of timed calls of every case")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS))
+    parser.add_argument("--output", default="data/benchmarks/hot_paths.json")
+    parser.add_argument("--baseline", help="The results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="The allowed relative slowdown of the median")
+    args = parser.parse_args()
+
+    # The rendering benchmark does not need a window
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+    results = run(args)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }, f, indent=2)
+
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+        regressions = compare(results, baseline, args.tolerance)
+
+        for case, ratio in regressions:
+            print(f"REGRESSION {case}: {ratio:.2f}x slower than the baseline")
+
+        if regressions:
+            sys.exit(1)
+
+        print(f"No regression against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
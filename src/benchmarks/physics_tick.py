@@ -0,0 +1,64 @@
+"""Measure the cost of a simulation sub-step when the physics is advanced once
+per robot (the old schedule, where every robot stepped the space when it was
+moved) against a single physics step for the whole swarm."""
+
+import time
+import argparse
+
+import pymunk
+
+# Local imports
+import constants
+
+from srobot import SRobot
+from swarm import SwarmController
+
+
+def build_swarm(swarm_size):
+    space = pymunk.Space()
+    target = pymunk.Body()
+    target.position = (600, 400)
+
+    swarm = SwarmController(start_pos=(200, 200), start_angle=0, sim_space=space,
+                            goal_pos=(100, 100), target=target,
+                            swarm_size=swarm_size,
+                            sensor_config=SRobot.get_sensor_config(backend="raycast"))
+
+    return space, swarm
+
+
+def measure(swarm_size, steps_per_tick, n_ticks):
+    """Return the time of a sub-step in milliseconds, when the space is stepped
+    `steps_per_tick` times for every sub-step."""
+
+    space, swarm = build_swarm(swarm_size)
+
+    start = time.perf_counter()
+    for _ in range(n_ticks):
+        for robot in swarm.robots:
+            robot.move(10)
+
+        for _ in range(steps_per_tick):
+            space.step(1/constants.FPS)
+
+    return (time.perf_counter() - start) / n_ticks * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        default=[3, 10, 50, 200])
+    parser.add_argument("--ticks", type=int, default=500)
+    args = parser.parse_args()
+
+    print(f"{'robots':>8} {'per robot (ms)':>15} {'single (ms)':>12} {'speedup':>8}")
+
+    for swarm_size in args.sizes:
+        legacy = measure(swarm_size, swarm_size + 1, args.ticks)
+        single = measure(swarm_size, 1, args.ticks)
+
+        print(f"{swarm_size:>8} {legacy:>15.3f} {single:>12.3f} {legacy / single:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
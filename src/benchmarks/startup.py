@@ -0,0 +1,86 @@
+"""Time the startup of fresh processes: the import of the main modules and of
+the command line interface.
+
+Every case is run in a new interpreter, so that nothing is already imported.
+The results are written as JSON and can be compared against a baseline, like
+the ones of `benchmarks.hot_paths`."""
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+
+# Local imports
+from benchmarks.hot_paths import summarize, compare
+
+
+CASES = {
+    "import sim": ["-c", "import sim"],
+    "import episodes": ["-c", "import episodes"],
+    "import load_stats": ["-c", "import load_stats"],
+    "main.py --help": ["main.py", "--help"],
+}
+
+
+def time_process(args, repeat):
+    """Returns the wall times (in seconds) of `repeat` runs of the interpreter
+    with the given arguments."""
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, *args], check=True,
+                       stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10,
+                        help="The number of runs of every case")
+    parser.add_argument("--only", nargs="+", choices=list(CASES))
+    parser.add_argument("--output", default="data/benchmarks/startup.json")
+    parser.add_argument("--baseline", help="The results of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="The allowed relative slowdown of the median")
+    args = parser.parse_args()
+
+    results = {}
+    for case in args.only or CASES:
+        results[case] = stats = summarize(time_process(CASES[case], args.repeat))
+        print(f"{case:<30} p50 {stats['p50_us'] / 1e3:>8.1f} ms   "
+              f"max {stats['max_us'] / 1e3:>8.1f} ms")
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }, f, indent=2)
+
+    print(f"Results written to {args.output}")
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+        regressions = compare(results, baseline, args.tolerance)
+
+        for case, ratio in regressions:
+            print(f"REGRESSION {case}: {ratio:.2f}x slower than the baseline")
+
+        if regressions:
+            sys.exit(1)
+
+        print(f"No regression against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure the time and the memory needed to create the robots of a swarm, when
+the fuzzy controller and the sensor configuration are shared by all of the 
+robots and when every robot has its own copies of them."""
+
+import math
+import time
+import argparse
+import tracemalloc
+
+import pymunk
+
+# Local imports
+from srobot import SRobot
+from fuzzy import RobotFuzzySystem
+from laser_sensor import SensorConfig
+from swarm import SwarmController
+
+
+def create_shared(n_robots):
+    """Create a swarm whose robots share the controller and the sensor 
+    configuration."""
+
+    return SwarmController(start_pos=(250, 250), start_angle=0, 
+                           sim_space=pymunk.Space(), goal_pos=(250, 250),
+                           target=None, swarm_size=n_robots)
+
+
+def create_per_robot(n_robots):
+    """Create the robots of a swarm, each with its own controller and sensor 
+    configuration."""
+
+    space = pymunk.Space()
+
+    return [SRobot(space, start_pos=(250 + 23 * math.cos(i), 250 + 23 * math.sin(i)),
+                   start_angle=0, 
+                   sensor_config=SensorConfig(**SRobot.SENSOR_PARAMS),
+                   flc=RobotFuzzySystem())
+            for i in range(n_robots)]
+
+
+def measure(create, n_robots, repeat):
+    """Returns the best construction time (in seconds) and the peak of the 
+    allocated memory (in bytes)."""
+
+    # Create the shared objects before measuring
+    create(2)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        create(n_robots)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    swarm = create(n_robots)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[3, 50, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'robots':>8} {'mode':>10} {'time [ms]':>10} {'memory [KB]':>12}")
+
+    for n_robots in args.sizes:
+        for mode, create in (("shared", create_shared), ("per-robot", create_per_robot)):
+            duration, peak = measure(create, n_robots, args.repeat)
+            print(f"{n_robots:>8} {mode:>10} {duration * 1000:>10.2f} {peak / 1024:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,24 @@
+from rl.callbacks import Callback
+
+# Local imports
+from metrics import MetricsWriter
+
+
+class MetricsCallback(Callback):
+    """keras-rl callback that streams the logs of every episode to a metrics
+    file as soon as the episode ends (see `MetricsWriter`).
+
+    The episodes are numbered from `start_episode`, so that a resumed run
+    continues the numbering of its metrics file.
+    """
+
+    def __init__(self, path, start_episode=0):
+        super().__init__()
+        self.writer = MetricsWriter(path)
+        self.start_episode = start_episode
+
+    def on_episode_end(self, episode, logs={}):
+        self.writer.write({"episode": self.start_episode + episode} | logs)
+
+    def on_train_end(self, logs={}):
+        self.writer.close()
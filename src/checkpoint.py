@@ -0,0 +1,331 @@
+import os
+import re
+import json
+import queue
+import random
+import threading
+
+import numpy as np
+
+from rl.callbacks import Callback
+
+# Local imports
+import log
+
+
+CHECKPOINT_PATTERN = re.compile(r"checkpoint_(\d+)\.npz$")
+
+# The attributes of a `SequentialMemory` that are saved with the checkpoints
+MEMORY_BUFFERS = ("observations", "actions", "rewards", "terminals",
+                  "recent_observations", "recent_terminals")
+
+
+class CheckpointCallback(Callback):
+    """keras-rl callback that periodically saves the state of the training, so
+    that a run can be resumed after a crash (see `load_checkpoint`).
+
+    A checkpoint holds the weights of the agent (and of its target model, for
+    DQN), the state of its optimizer, its replay memory, the step and episode
+    counters and the state of the random generators (python, numpy and the
+    seeds of the episodes of the simulation).
+
+    The state is copied on the training thread, but the file is written by a
+    background thread, so that the training is only paused for the copy. The
+    files are written at once, and only the last few are kept.
+    """
+
+    logger = log.create_logger(name="CheckpointCallback",
+                               level=log.LOG_INFO)
+
+    # The default number of steps between two checkpoints
+    INTERVAL = 10000
+
+    # The default number of checkpoints kept
+    KEEP = 3
+
+    def __init__(self, directory, interval=INTERVAL, keep=KEEP, *,
+                 start_step=0, start_episode=0, extra=None):
+        """
+        Args:
+            directory (str): The directory the checkpoints are written to.
+
+            interval (int, optional): The number of steps between two
+            checkpoints. Defaults to `CheckpointCallback.INTERVAL`.
+
+            keep (int, optional): The number of checkpoints kept, the older
+            ones are removed. Defaults to `CheckpointCallback.KEEP`.
+
+            start_step (int, optional): The number of steps already done, when
+            resuming a run, since keras-rl counts the steps of every call to
+            `fit` from zero. Defaults to 0.
+
+            start_episode (int, optional): The number of episodes already done,
+            when resuming a run. Defaults to 0.
+
+            extra (dict, optional): Other values saved with the checkpoints
+            (e.g. the path of the metrics file). They must be JSON serializable.
+        """
+
+        super().__init__()
+
+        assert interval > 0, "[CheckpointCallback] The interval must be positive"
+        assert keep > 0, "[CheckpointCallback] At least one checkpoint must be kept"
+
+        self.directory = directory
+        self.interval = interval
+        self.keep = keep
+        self.extra = extra or {}
+
+        self.step = start_step
+        self.episode = start_episode
+        self.last_saved = start_step
+
+        # Only one checkpoint waits to be written at a time, so that a slow
+        # disk can not pile up copies of the memory
+        self.pending = queue.Queue(maxsize=1)
+        self.writer = None
+
+    def on_train_begin(self, logs={}):
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.writer = threading.Thread(target=self.__write_loop,
+                                       name="CheckpointWriter",
+                                       daemon=True)
+        self.writer.start()
+
+    def on_step_end(self, step, logs={}):
+        self.step += 1
+
+        if self.step - self.last_saved >= self.interval:
+            self.save()
+
+    def on_episode_end(self, episode, logs={}):
+        self.episode += 1
+
+    def on_train_end(self, logs={}):
+        # Save the last steps, then wait for all of the files to be written
+        if self.step > self.last_saved:
+            self.save()
+
+        self.pending.put(None)
+        self.writer.join()
+
+    def save(self):
+        """Copy the state of the training and hand it to the writer."""
+
+        state = get_state(self.model, self.env)
+        state["step"] = self.step
+        state["episode"] = self.episode
+        state["extra"] = self.extra
+
+        self.last_saved = self.step
+        self.pending.put(state)
+
+    def __write_loop(self):
+        while (state := self.pending.get()) is not None:
+            try:
+                path = write_checkpoint(state, self.directory)
+                self.__rotate()
+
+                self.logger.info(f"Saved the checkpoint of step {state['step']} to {path}")
+            except Exception as e:
+                # A failed checkpoint must not stop the training
+                self.logger.error(f"Failed to save the checkpoint of step {state['step']}: {e!r}")
+
+    def __rotate(self):
+        """Remove the oldest checkpoints, keeping the last `keep`."""
+
+        for _, path in list_checkpoints(self.directory)[:-self.keep]:
+            os.remove(path)
+
+
+def _get_optimizer(agent):
+    optimizer = agent.trainable_model.optimizer
+
+    # keras-rl wraps the optimizer to add the updates of the target model,
+    # while the state is kept by the wrapped one
+    return getattr(optimizer, "optimizer", optimizer)
+
+
+def _get_optimizer_weights(optimizer):
+    if hasattr(optimizer, "get_weights"):
+        return optimizer.get_weights()
+
+    variables = optimizer.variables
+    if callable(variables):
+        variables = variables()
+
+    return [np.array(variable) for variable in variables]
+
+
+def _set_optimizer_weights(optimizer, weights):
+    if hasattr(optimizer, "set_weights"):
+        optimizer.set_weights(weights)
+        return
+
+    variables = optimizer.variables
+    if callable(variables):
+        variables = variables()
+
+    assert len(variables) == len(weights), \
+        f"[checkpoint] Expected {len(variables)} optimizer variables, got {len(weights)}"
+
+    for variable, value in zip(variables, weights):
+        variable.assign(value)
+
+
+def get_state(agent, env=None):
+    """Copy the state of the training of a keras-rl agent.
+
+    Returns:
+        dict: The arrays of the state under "arrays", and the rest of it (which
+        is JSON serializable) under "meta".
+    """
+
+    arrays = {}
+
+    for i, weights in enumerate(agent.model.get_weights()):
+        arrays[f"model/{i}"] = weights
+
+    if hasattr(agent, "target_model"):
+        for i, weights in enumerate(agent.target_model.get_weights()):
+            arrays[f"target_model/{i}"] = weights
+
+    for i, weights in enumerate(_get_optimizer_weights(_get_optimizer(agent))):
+        arrays[f"optimizer/{i}"] = np.array(weights)
+
+    memory = getattr(agent, "memory", None)
+    if memory is not None and all(hasattr(memory, name) for name in MEMORY_BUFFERS):
+        for name in MEMORY_BUFFERS:
+            arrays[f"memory/{name}"] = np.array(getattr(memory, name))
+
+    np_state = np.random.get_state()
+    arrays["np_random/keys"] = np_state[1]
+
+    meta = {
+        "python_random": random.getstate(),
+        "np_random": [np_state[0], *np_state[2:]],
+        "env_random": env.get_rng_state() if hasattr(env, "get_rng_state") else None,
+    }
+
+    return {"arrays": arrays, "meta": meta}
+
+
+def write_checkpoint(state, directory):
+    """Write a state (see `get_state`) to the checkpoint of its step, replacing
+    the file at once so that a crash can not leave a partial checkpoint.
+
+    Returns:
+        str: The path of the checkpoint.
+    """
+
+    meta = state["meta"] | {
+        "step": state["step"],
+        "episode": state["episode"],
+        "extra": state["extra"],
+    }
+
+    path = os.path.join(directory, f"checkpoint_{state['step']:09d}.npz")
+    tmp_path = f"{path[:-len('.npz')]}.tmp.npz"
+
+    np.savez(tmp_path, meta=np.array(json.dumps(meta)), **state["arrays"])
+    os.replace(tmp_path, path)
+
+    return path
+
+
+def list_checkpoints(directory):
+    """
+    Returns:
+        list: The (step, path) of the checkpoints of a directory, from the
+        oldest to the latest.
+    """
+
+    if not os.path.isdir(directory):
+        return []
+
+    checkpoints = []
+    for name in os.listdir(directory):
+        if (match := CHECKPOINT_PATTERN.fullmatch(name)) is not None:
+            checkpoints.append((int(match.group(1)), os.path.join(directory, name)))
+
+    return sorted(checkpoints)
+
+
+def latest_checkpoint(directory):
+    """Returns the path of the latest checkpoint of a directory, or None if
+    there is none."""
+
+    checkpoints = list_checkpoints(directory)
+
+    return checkpoints[-1][1] if checkpoints else None
+
+
+def load_checkpoint(path, agent, env=None, *, strict=True):
+    """Restore the state of the training of a keras-rl agent from a checkpoint.
+    The agent must already be compiled.
+
+    Args:
+        path (str): The checkpoint (see `latest_checkpoint`).
+        agent (rl.core.Agent): The agent, built as the one that was saved.
+        env (Simulation, optional): The simulation, whose episode seeds then
+        continue from where they were.
+        strict (bool, optional): If False, an optimizer state that does not
+        match the optimizer is only logged, and the optimizer starts again from
+        zero. Defaults to True.
+
+    Returns:
+        dict: The step and episode counters of the checkpoint, and its extra
+        values.
+
+    Raises:
+        RuntimeError: If `strict` and the optimizer state could not be restored.
+    """
+
+    with np.load(path) as data:
+        meta = json.loads(str(data["meta"]))
+
+        def get_list(prefix):
+            return [data[f"{prefix}/{i}"] for i in range(len(data.files))
+                    if f"{prefix}/{i}" in data.files]
+
+        agent.model.set_weights(get_list("model"))
+
+        if hasattr(agent, "target_model"):
+            agent.target_model.set_weights(get_list("target_model"))
+
+        optimizer_weights = get_list("optimizer")
+        if optimizer_weights:
+            optimizer = _get_optimizer(agent)
+
+            # The slots of some optimizers only exist after their first update,
+            # so they are created before being restored
+            if hasattr(optimizer, "build"):
+                optimizer.build(agent.trainable_model.trainable_weights)
+
+            try:
+                _set_optimizer_weights(optimizer, optimizer_weights)
+            except (AssertionError, ValueError) as e:
+                if strict:
+                    raise RuntimeError(f"[load_checkpoint] The optimizer state of {path} "
+                                       f"could not be restored") from e
+
+                CheckpointCallback.logger.warning(f"The optimizer state was not restored: {e}")
+
+        memory = getattr(agent, "memory", None)
+        if memory is not None and f"memory/{MEMORY_BUFFERS[0]}" in data.files:
+            for name in MEMORY_BUFFERS:
+                buffer = getattr(memory, name)
+                buffer.clear()
+                buffer.extend(data[f"memory/{name}"])
+
+        np_random = meta["np_random"]
+        np.random.set_state((np_random[0], data["np_random/keys"], *np_random[1:]))
+
+    version, internal_state, gauss_next = meta["python_random"]
+    random.setstate((version, tuple(internal_state), gauss_next))
+
+    if env is not None and meta["env_random"] is not None:
+        env.set_rng_state(meta["env_random"])
+
+    return {"step": meta["step"], "episode": meta["episode"], "extra": meta["extra"]}
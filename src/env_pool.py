@@ -0,0 +1,358 @@
+import time
+import traceback
+import multiprocessing as mp
+
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# Local imports
+import constants
+
+from sim import Simulation
+
+
+# The commands that a worker can be given
+CMD_STEP = 0
+CMD_RESET = 1
+CMD_CLOSE = 2
+
+# The size of the message of an error raised by a worker
+ERROR_SIZE = 4096
+
+
+def _buffer_specs(n_workers):
+    """Returns the shape and the type of every buffer shared with the workers,
+    with one row for every worker."""
+
+    return {
+        "commands": ((n_workers,), np.int8),
+        "actions": ((n_workers,), np.int64),
+        "observations": ((n_workers, Simulation.OBSERVATION_SPACE_N), np.float64),
+        "terminal_observations": ((n_workers, Simulation.OBSERVATION_SPACE_N), np.float64),
+        "rewards": ((n_workers,), np.float64),
+        "dones": ((n_workers,), np.bool_),
+        "truncated": ((n_workers,), np.bool_),
+        "substeps": ((n_workers,), np.int64),
+        "errors": ((n_workers, ERROR_SIZE), np.uint8),
+    }
+
+
+def _attach_buffers(shm_names, n_workers):
+    """Returns the shared memory blocks created by the pool, and the numpy views
+    on them."""
+
+    shms, buffers = {}, {}
+
+    for name, (shape, dtype) in _buffer_specs(n_workers).items():
+        shms[name] = shared_memory.SharedMemory(name=shm_names[name])
+        buffers[name] = np.ndarray(shape, dtype=dtype, buffer=shms[name].buf)
+
+    return shms, buffers
+
+
+def _worker(idx, n_workers, shm_names, start, finished, max_episode_steps, seed,
+            sim_kwargs):
+    """The main loop of a worker process, which owns a headless `Simulation`.
+
+    The worker waits for the `start` event, runs the command written in its row
+    of the shared buffers, writes the results back and sets the `finished`
+    event. If the command raises, its traceback is written to the `errors`
+    buffer instead, and the event is still set, so the pool can raise it.
+    """
+
+    shms, buffers = _attach_buffers(shm_names, n_workers)
+    sim = Simulation(headless=True, seed=seed, **sim_kwargs)
+    episode_steps = 0
+
+    while True:
+        start.wait()
+        start.clear()
+
+        command = buffers["commands"][idx]
+
+        if command == CMD_CLOSE:
+            break
+
+        buffers["errors"][idx] = 0
+
+        try:
+            truncated = False
+
+            if command == CMD_RESET:
+                observation, reward, done = sim.reset(), 0, False
+                info = {"substeps": 0}
+                episode_steps = 0
+            else:
+                observation, reward, done, info = sim.step(int(buffers["actions"][idx]))
+                episode_steps += 1
+
+                # The episode is also finished if it took too many steps
+                if max_episode_steps is not None and episode_steps >= max_episode_steps:
+                    truncated = not done
+                    done = True
+
+                # Reset the simulation if the episode is finished, and keep the
+                # last observation of the episode
+                if done:
+                    buffers["terminal_observations"][idx] = observation
+                    observation = sim.reset()
+                    episode_steps = 0
+
+            buffers["observations"][idx] = observation
+            buffers["rewards"][idx] = reward
+            buffers["dones"][idx] = done
+            buffers["truncated"][idx] = truncated
+            buffers["substeps"][idx] = info["substeps"]
+        except Exception:
+            message = traceback.format_exc().encode()[-(ERROR_SIZE - 1):]
+            buffers["errors"][idx, :len(message)] = np.frombuffer(message, dtype=np.uint8)
+        finally:
+            finished.set()
+
+    sim.close()
+
+    # Release the views before closing the shared memory blocks
+    del buffers
+    for shm in shms.values():
+        shm.close()
+
+
+class EnvPool:
+    """A pool of worker processes, each owning its own headless `Simulation`,
+    that are stepped together.
+
+    The actions, observations, rewards and done flags are exchanged through
+    shared memory buffers that are allocated once, with one row for every
+    worker, and the workers are only signaled with events.
+    """
+
+    OBSERVATION_SPACE_N = Simulation.OBSERVATION_SPACE_N
+    ACTION_SPACE_N = Simulation.ACTION_SPACE_N
+
+    # The number of seconds between two checks that the workers are alive,
+    # while waiting for them
+    POLL_INTERVAL = 1.0
+
+    def __init__(self, n_workers, *, max_episode_steps=constants.MAX_EP_STEPS,
+                 seed=None, timeout=None, **sim_kwargs):
+        """Start the worker processes.
+
+        Args:
+            n_workers (int): The number of worker processes.
+
+            max_episode_steps (int, optional): The maximum number of steps of an
+            episode, after which the simulation of a worker is reset. If None,
+            a simulation is only reset once the target arrived in the nest.
+            Defaults to constants.MAX_EP_STEPS.
+
+            seed (int, optional): The seed from which a different seed is
+            derived for the simulation of every worker (see `Simulation.seed`).
+            Defaults to None.
+
+            timeout (float, optional): The number of seconds after which a 
+            command that the workers did not finish raises a `TimeoutError`.
+            If None, the pool waits as long as the workers are alive. Defaults
+            to None. After a timeout, or once a worker died, the pool is broken
+            and can only be closed.
+
+            sim_kwargs: Other arguments given to every `Simulation`.
+        """
+
+        self.n_workers = n_workers
+        self.timeout = timeout
+        self.waiting = False
+
+        # The error that broke the pool, after which the workers are out of
+        # step and no other command can be given
+        self.broken = None
+
+        # Allocate the shared buffers
+        self.__shms = {}
+        self.__buffers = {}
+
+        for name, (shape, dtype) in _buffer_specs(n_workers).items():
+            nbytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            self.__shms[name] = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.__buffers[name] = np.ndarray(shape, dtype=dtype, buffer=self.__shms[name].buf)
+
+        shm_names = {name: shm.name for name, shm in self.__shms.items()}
+
+        # The workers are spawned, so that they do not inherit any pygame state
+        ctx = mp.get_context("spawn")
+
+        seeds = np.random.SeedSequence(seed).generate_state(n_workers)
+
+        self.__start = [ctx.Event() for _ in range(n_workers)]
+        self.__finished = [ctx.Event() for _ in range(n_workers)]
+        self.__workers = [
+            ctx.Process(target=_worker,
+                        args=(idx, n_workers, shm_names, self.__start[idx],
+                              self.__finished[idx], max_episode_steps, 
+                              int(seeds[idx]), sim_kwargs),
+                        daemon=True)
+            for idx in range(n_workers)
+        ]
+
+        for worker in self.__workers:
+            worker.start()
+
+    def __run(self, command):
+        """Give a command to all of the workers, without waiting for them."""
+
+        assert not self.waiting, "[EnvPool] The pool is already running a step"
+
+        if self.broken is not None and command != CMD_CLOSE:
+            raise RuntimeError("[EnvPool] The pool is broken and can only be closed") \
+                  from self.broken
+
+        self.__buffers["commands"][:] = command
+
+        for start in self.__start:
+            start.set()
+
+        self.waiting = True
+
+    def __wait(self):
+        """Wait for all of the workers to finish their command.
+
+        Raises:
+            RuntimeError: If a worker died, or if the command raised in a 
+            worker.
+
+            TimeoutError: If the workers did not finish within the timeout.
+
+            In both of the first cases the pool is broken, since the other 
+            workers may still finish the command later.
+        """
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+
+        try:
+            for idx, finished in enumerate(self.__finished):
+                while not finished.wait(self.POLL_INTERVAL):
+                    if not self.__workers[idx].is_alive():
+                        self.broken = RuntimeError(f"[EnvPool] Worker {idx} died with exit "
+                                                   f"code {self.__workers[idx].exitcode}")
+                        raise self.broken
+
+                    if deadline is not None and time.monotonic() > deadline:
+                        self.broken = TimeoutError(f"[EnvPool] Worker {idx} did not finish "
+                                                   f"within {self.timeout}s")
+                        raise self.broken
+
+                finished.clear()
+        finally:
+            self.waiting = False
+
+        errors = [(idx, bytes(error).rstrip(b"\0").decode(errors="replace"))
+                  for idx, error in enumerate(self.__buffers["errors"]) if error[0] != 0]
+
+        if errors:
+            raise RuntimeError("[EnvPool] The command failed in the workers:\n" + 
+                               "\n".join(f"Worker {idx}:\n{error}" for idx, error in errors))
+
+    def reset(self):
+        """Reset the simulations of all of the workers.
+
+        Returns:
+            numpy.ndarray: The observations, with one row for every worker.
+        """
+
+        self.__run(CMD_RESET)
+        self.__wait()
+
+        return self.__buffers["observations"].copy()
+
+    def step_async(self, actions):
+        """Start a step of all of the simulations, without waiting for it to
+        finish (see `step_wait`).
+
+        Args:
+            actions (numpy.ndarray): The action for every worker.
+        """
+
+        assert len(actions) == self.n_workers, \
+                "[EnvPool.step_async] There has to be an action for every worker"
+
+        self.__buffers["actions"][:] = actions
+        self.__run(CMD_STEP)
+
+    def step_wait(self):
+        """Wait for the step started by `step_async` to finish.
+
+        A simulation whose episode is done is reset, and the observation
+        returned for it is the first one of the new episode, while the last one
+        is saved in its info dict as `"terminal_observation"`. If the episode
+        was ended by `max_episode_steps` rather than by the simulation, the info
+        dict also holds `"TimeLimit.truncated"`, like for `VecSimulation`. The
+        info dicts also hold the number of sub-steps the actions took as 
+        `"substeps"`.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, numpy.ndarray, list): The
+            observations, the rewards, the done flags and the info dicts of all
+            the workers.
+        """
+
+        self.__wait()
+
+        dones = self.__buffers["dones"].copy()
+        infos = [{"substeps": int(substeps)} for substeps in self.__buffers["substeps"]]
+
+        for idx, done in enumerate(dones):
+            if done:
+                infos[idx]["terminal_observation"] = self.__buffers["terminal_observations"][idx].copy()
+
+                if self.__buffers["truncated"][idx]:
+                    infos[idx]["TimeLimit.truncated"] = True
+
+        return self.__buffers["observations"].copy(), \
+               self.__buffers["rewards"].copy(), dones, infos
+
+    def step(self, actions):
+        """Advance all of the simulations one step and wait for them (see
+        `step_async` and `step_wait`)."""
+
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        """Stop the workers and free the shared buffers."""
+
+        # The pool was already closed
+        if not self.__shms:
+            return
+
+        # The workers that failed are stopped anyway
+        if self.waiting:
+            try:
+                self.__wait()
+            except (RuntimeError, TimeoutError):
+                pass
+
+        self.__run(CMD_CLOSE)
+
+        # The workers of a broken pool may be stuck, so they are only given a
+        # moment to stop
+        for worker in self.__workers:
+            worker.join(self.POLL_INTERVAL if self.broken is not None else self.timeout)
+
+            if worker.is_alive():
+                worker.terminate()
+                worker.join()
+
+        self.waiting = False
+        self.__buffers.clear()
+
+        for shm in self.__shms.values():
+            shm.close()
+            shm.unlink()
+
+        self.__shms.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
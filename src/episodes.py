@@ -1,22 +1,21 @@
 import os 
 import time
-import json
 import random
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'  # Suppress tensorflow warnings
 
-from datetime import datetime
-from keras.models import Sequential
-from keras.layers import Dense, Flatten
-from keras.optimizers import Adam
+import numpy as np
 
-from rl.agents import SARSAAgent, DQNAgent
-from rl.policy import BoltzmannQPolicy
-from rl.memory import SequentialMemory
+from datetime import datetime
 
 # Local imports 
 import constants
 
 from sim import Simulation
+from metrics import MetricsWriter, truncate_metrics
+
+# NOTE: keras, keras-rl and tensorflow take seconds to import, so they are only
+# imported by the functions that train or test an agent, and not by the 
+# processes that only run the simulation (e.g. `run_random`)
 
 
 def create_nn():
@@ -24,6 +23,9 @@ def create_nn():
     # 3, to represent vtras and vrot (I ignored the scaling part for now and
     # I assumed that the swarm is already in an optimal scaling from the beginning)
 
+    from keras.models import Sequential
+    from keras.layers import Dense, Flatten
+
     model = Sequential()
     model.add(Flatten(input_shape=(1, Simulation.OBSERVATION_SPACE_N,)))
     model.add(Dense(64, activation="tanh"))
@@ -33,15 +35,45 @@ def create_nn():
     return model
 
 
-def run_random():
-    """Run the simulation using random actions."""
+def set_seed(seed):
+    """Seed the random generators used by the agents (python, numpy and
+    tensorflow)."""
+
+    import tensorflow as tf
+
+    random.seed(seed)
+    np.random.seed(seed)
+    tf.random.set_seed(seed)
+
+
+def run_random(*, max_steps=35000, max_episode_steps=None, seed=None, 
+               sim_kwargs=None, output_dir="data"):
+    """Run the simulation using random actions.
+
+    Args:
+        max_steps (int, optional): The number of steps of the run. Defaults to
+        35000.
+
+        max_episode_steps (int, optional): The maximum number of steps of an
+        episode. If None, an episode only ends when the target is in the nest.
+
+        seed (int, optional): The seed of the simulation and of the actions.
+
+        sim_kwargs (dict, optional): Other arguments of the `Simulation`.
+
+        output_dir (str, optional): The directory of the metrics file. Defaults
+        to "data".
+
+    Returns:
+        str: The path of the metrics file of the run.
+    """
 
-    sim = Simulation()
-    max_steps = 35000
+    sim = Simulation(seed=seed, **(sim_kwargs or {}))
+    rng = random.Random(seed)
 
-    episode_reward = []
-    nb_episode_steps = []
-    nb_steps = []
+    metrics_file = get_metrics_file(prefix="rnd", output_dir=output_dir)
+    writer = MetricsWriter(metrics_file)
+    episode = 0
 
     ep_reward = 0
     ep_steps = 0
@@ -51,7 +83,7 @@ def run_random():
 
     while steps < max_steps:
         # Generate the next random action 
-        action = random.randint(0, 1)
+        action = rng.randint(0, 1)
 
         _, reward, done, _ = sim.step(action)
 
@@ -59,32 +91,91 @@ def run_random():
         ep_steps += 1
         steps += 1
 
-        if done is True:
-            episode_reward.append(ep_reward)
-            nb_episode_steps.append(ep_steps)
-            nb_steps.append(steps)
+        if max_episode_steps is not None and ep_steps >= max_episode_steps:
+            done = True
 
+        if done is True:
+            writer.write({
+                "episode": episode,
+                "episode_reward": ep_reward,
+                "nb_episode_steps": ep_steps,
+                "nb_steps": steps,
+            })
+
+            episode += 1
             ep_reward = 0
             ep_steps = 0
 
             sim.reset()
     
+    writer.close()
+    sim.close()
+
     end_time = time.time()
     print(f"Ran for {end_time-start_time}s")
 
-    history = {
-        "episode_reward": episode_reward,
-        "nb_episode_steps": nb_episode_steps,
-        "nb_steps": nb_steps,
-    }
+    return metrics_file
+
+
+def run_episodes_dqn(mode=None, *, nb_steps=200000, learning_rate=3e-4,
+                     max_episode_steps=constants.MAX_EP_STEPS, seed=None,
+                     sim_kwargs=None, output_dir="data", models_dir="models",
+                     checkpoint_dir=None, checkpoint_interval=None,
+                     resume=False, weights_file=None):
+    """Run the simulation using the DQN RL method.
+
+    Args:
+        mode (str, optional): If "test", the trained weights are loaded and 
+        tested, otherwise the agent is trained from zero.
+
+        nb_steps (int, optional): The number of training steps. Defaults to
+        200000.
+
+        learning_rate (float, optional): The learning rate of the optimizer.
+        Defaults to 3e-4.
+
+        max_episode_steps (int, optional): The maximum number of steps of an
+        episode. Defaults to constants.MAX_EP_STEPS.
+
+        seed (int, optional): The seed of the simulation and of the agent.
+
+        sim_kwargs (dict, optional): Other arguments of the `Simulation`.
+
+        output_dir (str, optional): The directory of the metrics file. Defaults
+        to "data".
+
+        models_dir (str, optional): The directory the trained weights are saved
+        in. Defaults to "models".
+
+        checkpoint_dir (str, optional): The directory the training is
+        checkpointed in (see `CheckpointCallback`). If None, no checkpoint is
+        saved.
 
-    dump_to_file(history, prefix="rnd")
+        checkpoint_interval (int, optional): The number of steps between two
+        checkpoints. If None, it defaults to `CheckpointCallback.INTERVAL`.
 
+        resume (bool, optional): If True, the training continues from the
+        latest checkpoint of `checkpoint_dir`, if there is one, for the steps
+        that are left. Defaults to False.
 
-def run_episodes_dqn(mode=None):
-    """Run the simulation using the DQN RL method."""
+        weights_file (str, optional): The weights tested in the "test" mode. 
+        Defaults to the weights of the reference run.
 
-    sim = Simulation()
+    Returns:
+        str: The path of the metrics file of the run.
+    """
+
+    from keras.optimizers import Adam
+    from rl.agents import DQNAgent
+    from rl.policy import BoltzmannQPolicy
+    from rl.memory import SequentialMemory
+
+    from callbacks import MetricsCallback
+
+    if seed is not None:
+        set_seed(seed)
+
+    sim = Simulation(seed=seed, **(sim_kwargs or {}))
     model = create_nn()
 
     memory = SequentialMemory(limit=50000, window_length=1)
@@ -98,37 +189,64 @@ def run_episodes_dqn(mode=None):
                    policy=policy,
                    test_policy=policy)
 
-    dqn.compile(Adam(learning_rate=3e-4), metrics=['mae'])
+    dqn.compile(Adam(learning_rate=learning_rate), metrics=['mae'])
     
     if mode == "test":
-        weights_filename = "data/dqn_weights_2023-06-01 16:44:28.838974.h5f"
+        weights_filename = weights_file or "data/dqn_weights_2023-06-01 16:44:28.838974.h5f"
 
         # load the weights
         dqn.load_weights(weights_filename)
 
+        metrics_file = get_metrics_file(prefix="dqn-test", output_dir=output_dir)
         dqn.test(sim,
                  nb_episodes=5,
-                 nb_max_episode_steps=constants.MAX_EP_STEPS)
+                 nb_max_episode_steps=max_episode_steps,
+                 callbacks=[MetricsCallback(metrics_file)])
+        sim.close()
 
-        return 
+        return metrics_file
 
-    history = dqn.fit(sim, 
-                      nb_steps=200000, 
-                      verbose=2,
-                      nb_max_episode_steps=constants.MAX_EP_STEPS)
-    
-    dump_to_file(history.history, prefix="dqn")
+    metrics_file = fit_agent(dqn, sim, 
+                             prefix="dqn",
+                             nb_steps=nb_steps,
+                             max_episode_steps=max_episode_steps,
+                             output_dir=output_dir,
+                             checkpoint_dir=checkpoint_dir,
+                             checkpoint_interval=checkpoint_interval,
+                             resume=resume)
 
     # Save the weights 
-    dqn.save_weights(f'models/dqn_weights_{datetime.today()}.h5f', overwrite=False)
+    dqn.save_weights(os.path.join(models_dir, f'dqn_weights_{datetime.today()}.h5f'), 
+                     overwrite=False)
+    sim.close()
+
+    return metrics_file
+
 
+def run_episodes_sarsa(mode=None, *, nb_steps=200000, learning_rate=3e-4,
+                       max_episode_steps=constants.MAX_EP_STEPS, seed=None,
+                       sim_kwargs=None, output_dir="data", models_dir="models",
+                       checkpoint_dir=None, checkpoint_interval=None,
+                       resume=False, weights_file=None):
+    """Run the simulation using the SARSA RL method.
 
-def run_episodes_sarsa(mode=None):
-    """Run the simulation using the SARSA RL method."""
+    Takes the same arguments as `run_episodes_dqn`.
 
-    sim = Simulation()
+    Returns:
+        str: The path of the metrics file of the run.
+    """
+
+    from keras.optimizers import Adam
+    from rl.agents import SARSAAgent
+    from rl.policy import BoltzmannQPolicy
+
+    from callbacks import MetricsCallback
+
+    if seed is not None:
+        set_seed(seed)
+
+    sim = Simulation(seed=seed, **(sim_kwargs or {}))
     model = create_nn()
-    
 
     policy = BoltzmannQPolicy()
     sarsa = SARSAAgent(model=model,
@@ -137,37 +255,96 @@ def run_episodes_sarsa(mode=None):
                        policy=policy,
                        test_policy=policy)
     
-    sarsa.compile(Adam(learning_rate=3e-4), metrics=['mae'])
+    sarsa.compile(Adam(learning_rate=learning_rate), metrics=['mae'])
     
     if mode == "test":
-        weights_filename = "data/sarsa_weights_2023-06-21 14:18:26.608588.h5f"
+        weights_filename = weights_file or "data/sarsa_weights_2023-06-21 14:18:26.608588.h5f"
 
         # load the weights
         sarsa.load_weights(weights_filename)
 
-        history = sarsa.test(sim,
-                             nb_episodes=100,
-                             nb_max_episode_steps=constants.MAX_EP_STEPS)
-        
-        print(history.history)
-        dump_to_file(history.history, prefix="sarsa-3")
+        metrics_file = get_metrics_file(prefix="sarsa-3", output_dir=output_dir)
+        sarsa.test(sim,
+                   nb_episodes=100,
+                   nb_max_episode_steps=max_episode_steps,
+                   callbacks=[MetricsCallback(metrics_file)])
+        sim.close()
 
-        return 
+        return metrics_file
 
-    history = sarsa.fit(sim, 
-                        nb_steps=200000, 
-                        verbose=2,
-                        nb_max_episode_steps=constants.MAX_EP_STEPS)
-    
-    dump_to_file(history.history, prefix="sarsa")
+    metrics_file = fit_agent(sarsa, sim, 
+                             prefix="sarsa",
+                             nb_steps=nb_steps,
+                             max_episode_steps=max_episode_steps,
+                             output_dir=output_dir,
+                             checkpoint_dir=checkpoint_dir,
+                             checkpoint_interval=checkpoint_interval,
+                             resume=resume)
 
     # Save the weights 
-    sarsa.save_weights(f'models/sarsa_weights_{datetime.today()}.h5f', overwrite=False)
+    sarsa.save_weights(os.path.join(models_dir, f'sarsa_weights_{datetime.today()}.h5f'), 
+                       overwrite=False)
+    sim.close()
+
+    return metrics_file
+
+
+def fit_agent(agent, sim, *, prefix, nb_steps, max_episode_steps, output_dir,
+              checkpoint_dir=None, checkpoint_interval=None,
+              resume=False):
+    """Train a compiled agent, checkpointing the training if `checkpoint_dir`
+    is given, and resuming it from its latest checkpoint if `resume` is True.
+
+    A resumed run only takes the steps that are left, and keeps writing to the
+    metrics file of the run it continues, from which the episodes that ended
+    after the checkpoint are removed first, since they are run again.
+
+    Returns:
+        str: The path of the metrics file of the run.
+    """
+
+    from callbacks import MetricsCallback
+    from checkpoint import CheckpointCallback, latest_checkpoint, load_checkpoint
+
+    start = {"step": 0, "episode": 0, "extra": {}}
+
+    if resume:
+        assert checkpoint_dir is not None, "[fit_agent] Resuming needs a checkpoint directory"
+
+        checkpoint = latest_checkpoint(checkpoint_dir)
+        if checkpoint is not None:
+            start = load_checkpoint(checkpoint, agent, sim)
+            print(f"Resuming from {checkpoint} at step {start['step']}")
+
+    metrics_file = start["extra"].get("metrics_file")
+
+    if metrics_file is not None:
+        truncate_metrics(metrics_file, start["episode"])
+    else:
+        metrics_file = get_metrics_file(prefix=prefix, output_dir=output_dir)
+
+    callbacks = [MetricsCallback(metrics_file, start_episode=start["episode"])]
+    if checkpoint_dir is not None:
+        callbacks.append(CheckpointCallback(checkpoint_dir,
+                                            interval=checkpoint_interval or CheckpointCallback.INTERVAL,
+                                            start_step=start["step"],
+                                            start_episode=start["episode"],
+                                            extra={"metrics_file": metrics_file}))
+
+    if nb_steps > start["step"]:
+        agent.fit(sim, 
+                  nb_steps=nb_steps - start["step"], 
+                  verbose=2,
+                  nb_max_episode_steps=max_episode_steps,
+                  callbacks=callbacks)
+
+    return metrics_file
+
 
+def get_metrics_file(prefix, output_dir="data"):
+    """Return the path of the metrics stream of a new run (see `MetricsWriter`)."""
 
-def dump_to_file(data, prefix):
-    with open(f'data/{prefix}_data{datetime.today()}.json', 'w') as f:
-        json.dump(data, f, default=int)
+    return os.path.join(output_dir, f'{prefix}_data{datetime.today()}.jsonl')
 
 if __name__ == "__main__":
     run_episodes_sarsa("test")
\ No newline at end of file
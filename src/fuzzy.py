@@ -1,8 +1,68 @@
+import sys
 import math
-import matplotlib.pyplot as plt
+import types
+import functools
+import hashlib
+import importlib
+import threading
 import numpy as np 
 
-from fuzzylogic.functions import triangular, linear
+
+class _DeferredModule(types.ModuleType):
+    """Stands for a module that is only imported when one of its attributes is
+    first used."""
+
+    def __getattr__(self, name):
+        module = importlib.import_module(self.__name__)
+
+        # The stand-in is still in `sys.modules` while fuzzylogic is imported,
+        # so the real module can not be used yet
+        if module is self:
+            raise AttributeError(f"[_DeferredModule] {self.__name__} is used before "
+                                 f"it is imported, while looking up {name!r}")
+
+        return getattr(module, name)
+
+
+# Held while the stand-ins of matplotlib are in `sys.modules`
+_import_lock = threading.Lock()
+
+
+def _import_fuzzylogic():
+    """Import `fuzzylogic`, which imports `matplotlib.pyplot` only to plot the
+    sets, although that takes most of the time needed to import the simulation.
+    It is given stand-ins for matplotlib instead, so that pyplot is only
+    imported when a set is plotted.
+
+    This relies on fuzzylogic (pinned to 1.2.0 in requirements.txt) only using
+    pyplot in `Set.plot`, and not when it is imported. The stand-ins are only
+    in `sys.modules` for the import of `fuzzylogic.classes`, and removed right
+    after it."""
+
+    names = ("matplotlib", "matplotlib.pyplot")
+
+    with _import_lock:
+        if any(name in sys.modules for name in names):
+            import fuzzylogic.classes
+            return
+
+        matplotlib, pyplot = (_DeferredModule(name) for name in names)
+        matplotlib.pyplot = pyplot
+        sys.modules.update(zip(names, (matplotlib, pyplot)))
+
+        try:
+            import fuzzylogic.classes
+        finally:
+            for name in names:
+                # Only remove the stand-ins, if the real modules were not
+                # imported meanwhile
+                if isinstance(sys.modules.get(name), _DeferredModule):
+                    del sys.modules[name]
+
+
+_import_fuzzylogic()
+
+from fuzzylogic import functions
 from fuzzylogic.classes import Domain, Set, FuzzyWarning, Rule
 
 class RuleModified(Rule):
@@ -80,11 +140,8 @@ class RuleModified(Rule):
 
                 # If x is nonzero, then the fuzzy term is activated
                 if x > 0:
-                    # Compute the rule output level 
-                    z = [x for x in v.domain.range if v.func(x) == 1][0]
-
-                    if z is None:
-                        raise FuzzyWarning("Singleton function not properly implemented.") 
+                    # Get the rule output level 
+                    z = singleton_value(v)
 
                     # Append a tuple of the form (fuzzy term, x, z)
                     weights.append((v, x, z))
@@ -109,6 +166,8 @@ class DomainModified(Domain):
 
     def view(self):
         """Plot all of the terms in the set."""
+        import matplotlib.pyplot as plt
+
         fig = plt.figure()
 
         for s in self._sets.values():
@@ -132,6 +191,8 @@ def plot(set_obj):
         set_obj (Set): An instance of the Set object.
     """
 
+    import matplotlib.pyplot as plt
+
     if set_obj.domain is None:
         raise FuzzyWarning("No domain assigned, cannot plot")
         
@@ -168,12 +229,64 @@ def singleton(p, *, no_m=0, c_m=1):
     for a floating point number, because of the representation errors, this 
     would always return false. Thus, for comparation purposes, `math.isclose()` 
     was used instead.
+
+    The crisp value of the singleton is saved as the `value` attribute of the
+    returned function, so that it does not have to be searched for in the 
+    domain (see `singleton_value`).
     """
 
     assert 0 <= no_m < c_m <= 1
 
     def f(x):
         return c_m if math.isclose(x, p, abs_tol=1e-9) else no_m
+    
+    f.value = p
+    return f
+
+
+def singleton_value(set_obj):
+    """Return the crisp value of a Set created with `singleton`.
+
+    Args:
+        set_obj (Set): An instance of the Set object.
+
+    Raises:
+        FuzzyWarning: If the Set is not a singleton.
+    """
+
+    value = getattr(set_obj.func, "value", None)
+
+    if value is None:
+        raise FuzzyWarning(f"{set_obj.name} is not a singleton fuzzy set.")
+
+    return value
+
+
+def linear(m=0, b=0):
+    """Wrapper of the `linear` function found in the `fuzzylogic.functions` 
+    module.
+
+    The parameters of the membership function are saved as the `params` 
+    attribute of the returned function, so that it can also be evaluated for 
+    many values at once (see `RobotFuzzySystem.evaluate_batch`).
+    """
+
+    f = functions.linear(m=m, b=b)
+    f.params = ("linear", m, b)
+    return f
+
+
+def triangular(low, high, *, c=None):
+    """Wrapper of the `triangular` function found in the `fuzzylogic.functions`
+    module.
+
+    The parameters of the membership function are saved as the `params` 
+    attribute of the returned function, so that it can also be evaluated for 
+    many values at once (see `RobotFuzzySystem.evaluate_batch`).
+    """
+
+    f = functions.triangular(low, high, c=c)
+    f.params = ("triangular", low, high, c if c is not None else (low + high) / 2.)
     return f
 
 
@@ -226,6 +339,10 @@ class RobotFuzzySystem:
         self.vtrans.medium = singleton(55)
         self.vtrans.high = singleton(100)
 
+        # Compile the rule base once, so that it is not rebuilt on every
+        # evaluation of the controller
+        self.__compile_rules()
+
     def __init_percep_set(self, name):
         """This method should be used for the terms related to zones perception.
         
@@ -303,33 +420,209 @@ class RobotFuzzySystem:
             (self.front.near,) : self.vtrans.medium 
         }
     
-    def evaluate(self, inp_left, inp_front, inp_right, inp_ang, inp_dist):
-        """Fuzzy logic controller that combines the rendevous and avoidance FLCs.
-        
+    def __get_rules_vrot(self):
+        """
         Returns:
-            [float, float]: List containing the defuzzified values for vtrans 
-            (translational speed) and for vrot (rotational speed) in this order."""
-
-        input_data = {
-            self.left: inp_left,
-            self.front: inp_front,
-            self.right: inp_right,
-            self.ang: inp_ang,
-            self.dist: inp_dist
-        }
+            dict: All of the rules having `vrot` as consequent. The avoidance
+            rules are only used when the goal is at a far or medium distance.
+        """
 
-        rendevous_rules_vrot = self.__get_rendevous_rules_vrot()
-        rendevous_rules_vtrans = self.__get_rendevous_rules_vtrans()
         avoidance_rules = {}
 
         # Save in the new dict the avoidance rules with extended constraints
         for antecedents, consequent in self.__get_avoidance_rules().items():
             rule_updated = antecedents + (self.dist.far, self.dist.med,)
             avoidance_rules[rule_updated] = consequent
+
+        return self.__get_rendevous_rules_vrot() | avoidance_rules
+
+    def __compile_rules(self):
+        """Compile the rule base into flat arrays.
+
+        Every fuzzy term of the input domains gets an index in the vector of
+        membership values, whose last element is always 1. For every rule, the
+        indices of its antecedent terms are stored in a row of a matrix, padded
+        with the index of that last element, so that the activation of all of
+        the rules is the minimum over the rows. The output levels of the
+        singleton consequents are stored in a separate array.
+        """
+
+        # The input terms, as pairs of the position of their input and their
+        # membership function
+        self.__terms = []
+        term_idxs = {}
+
+        for inp_idx, domain in enumerate((self.left, self.front, self.right, 
+                                          self.ang, self.dist)):
+            for term in domain._sets.values():
+                term_idxs[term] = len(self.__terms)
+                self.__terms.append((inp_idx, term.func))
+
+        def compile_rules(rules):
+            # The antecedents of a rule are unordered, just like for a `Rule`,
+            # so a later rule with the same antecedents replaces an earlier one
+            rules = {frozenset(K): v for K, v in rules.items()}
+
+            n_antecedents = max(len(antecedents) for antecedents in rules)
+            antecedents = np.full((len(rules), n_antecedents), len(self.__terms))
+            consequents = np.empty(len(rules))
+
+            for i, (K, v) in enumerate(rules.items()):
+                antecedents[i, :len(K)] = sorted(term_idxs[k] for k in K)
+
+                # Get the rule output level
+                consequents[i] = singleton_value(v)
+
+            return antecedents, consequents
+
+        # Group the input terms by the kind of their membership function, for
+        # the evaluation of many sets of inputs at once
+        linear_terms, triangular_terms = [], []
+
+        for col, (inp_idx, func) in enumerate(self.__terms):
+            kind, *params = getattr(func, "params", (None,))
+
+            if kind == "linear":
+                linear_terms.append((col, inp_idx, *params))
+            elif kind == "triangular":
+                low, high, c = params
+                triangular_terms.append((col, inp_idx, low, c, 1 / (c - low), 1 / (high - c)))
+            else:
+                raise FuzzyWarning("Only linear and triangular input terms are supported.")
+
+        self.__linear_terms = tuple(np.array(column) for column in zip(*linear_terms))
+        self.__triangular_terms = tuple(np.array(column) for column in zip(*triangular_terms))
+
+        self.__rules_vtrans = compile_rules(self.__get_rendevous_rules_vtrans())
+        self.__rules_vrot = compile_rules(self.__get_rules_vrot())
+
+    @staticmethod
+    def __defuzzify(memberships, antecedents, consequents):
+        """Zero-order Takagi-Sugeno defuzzification of a compiled rule set (see 
+        `RuleModified`).
+
+        Returns:
+            float: The weighted average of the output levels of the activated
+            rules, or None if no rule was activated.
+        """
+
+        # The activation of each rule is the minimum of its antecedents
+        weights = memberships[antecedents].min(axis=1)
+        active = np.flatnonzero(weights > 0)
+
+        # If nothing was activated, return None
+        if active.size == 0:
+            return None
+
+        x = weights[active].tolist()
+        z = consequents[active].tolist()
+
+        return sum(zi * xi for zi, xi in zip(z, x)) / sum(x)
+    
+    @staticmethod
+    def __defuzzify_batch(memberships, antecedents, consequents):
+        """Zero-order Takagi-Sugeno defuzzification of a compiled rule set for
+        many sets of inputs at once.
+
+        Args:
+            memberships (numpy.ndarray): The membership values of the input 
+            terms, with one row for every set of inputs.
+
+        Returns:
+            numpy.ndarray: The weighted averages of the output levels of the
+            activated rules, or NaN for the rows where no rule was activated.
+        """
+
+        # The activation of each rule is the minimum of its antecedents
+        weights = memberships[:, antecedents].min(axis=-1)
+        total = weights.sum(axis=1)
+
+        output = np.full(len(memberships), np.nan)
+        active = total > 0
+        output[active] = weights[active] @ consequents / total[active]
+
+        return output
+
+    def fingerprint(self):
+        """
+        Returns:
+            str: A hash of the parameters of all of the membership functions
+            and of the compiled rule base, which changes whenever the behaviour
+            of the controller changes.
+        """
+
+        def func_params(func):
+            # The parameters of a membership function are saved in its closure,
+            # which can also hold other membership functions
+            cells = [c.cell_contents for c in (func.__closure__ or ())]
+            return func.__qualname__, [func_params(c) if callable(c) else c for c in cells]
+
+        params = [(d._name, d._low, d._high, d._res,
+                   [(name, func_params(term.func)) for name, term in d._sets.items()])
+                  for d in (self.left, self.front, self.right, self.ang, self.dist,
+                            self.vrot, self.vtrans)]
+
+        digest = hashlib.sha1(repr(params).encode())
+        for array in self.__rules_vtrans + self.__rules_vrot:
+            digest.update(array.tobytes())
+
+        return digest.hexdigest()
+
+    def evaluate(self, inp_left, inp_front, inp_right, inp_ang, inp_dist):
+        """Fuzzy logic controller that combines the rendevous and avoidance FLCs.
         
-        rules_vtrans = RuleModified(rendevous_rules_vtrans)
-        rules_vrot = RuleModified((rendevous_rules_vrot | avoidance_rules))
+        Returns:
+            [float, float]: List containing the defuzzified values for vtrans 
+            (translational speed) and for vrot (rotational speed) in this order."""
+
+        inputs = (inp_left, inp_front, inp_right, inp_ang, inp_dist)
+
+        # Compute the membership value of every input term
+        memberships = np.array([func(inputs[i]) for i, func in self.__terms] + [1.0])
 
         # Returned the defuzzified results separate for vtrans and vrot
-        return rules_vtrans(input_data, method="tagaki-sugeno-0"), \
-                rules_vrot(input_data, method="tagaki-sugeno-0")
\ No newline at end of file
+        return self.__defuzzify(memberships, *self.__rules_vtrans), \
+                self.__defuzzify(memberships, *self.__rules_vrot)
+
+    def evaluate_batch(self, inp_left, inp_front, inp_right, inp_ang, inp_dist):
+        """Evaluate the fuzzy logic controller for many sets of inputs at once,
+        e.g. for all the robots of a swarm.
+
+        Args:
+            All of the inputs are arrays of the same length, holding one value
+            for every set of inputs.
+        
+        Returns:
+            (numpy.ndarray, numpy.ndarray): The defuzzified values for vtrans
+            and vrot. The values are NaN where no rule was activated.
+        """
+
+        inputs = np.column_stack((inp_left, inp_front, inp_right, inp_ang, 
+                                  inp_dist)).astype(float)
+
+        # Compute the membership values of every input term, with one row for
+        # every set of inputs, and with the last column always 1. The terms 
+        # with the same kind of membership function are computed together
+        memberships = np.ones((len(inputs), len(self.__terms) + 1))
+
+        cols, inp_idxs, m, b = self.__linear_terms
+        memberships[:, cols] = np.clip(m * inputs[:, inp_idxs] + b, 0, 1)
+
+        # This is the same computation as the one done by the triangular 
+        # function of the `fuzzylogic.functions` module
+        cols, inp_idxs, low, c, left_gradient, right_gradient = self.__triangular_terms
+        x = inputs[:, inp_idxs]
+        memberships[:, cols] = np.where(x <= c, 
+                                        np.clip(left_gradient * (x - low), 0, 1),
+                                        1 - np.clip(right_gradient * (x - c), 0, 1))
+
+        return self.__defuzzify_batch(memberships, *self.__rules_vtrans), \
+                self.__defuzzify_batch(memberships, *self.__rules_vrot)
+
+
+@functools.lru_cache(maxsize=None)
+def shared_fuzzy_system():
+    """Return the `RobotFuzzySystem` shared by all of the robots. It is created
+    only once per process, and it must not be modified."""
+
+    return RobotFuzzySystem()
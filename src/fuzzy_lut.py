@@ -0,0 +1,361 @@
+import os
+import functools
+import hashlib
+import itertools
+
+import numpy as np
+
+# Local imports
+import log
+
+from fuzzy import RobotFuzzySystem, shared_fuzzy_system
+
+
+class FuzzyLookupTable:
+    """Approximation of the `RobotFuzzySystem` controller by a lookup table.
+
+    The controller is a pure function of five inputs (left, front and right
+    distances, angle to goal and distance to goal), so it is sampled once over
+    a grid and the values of vtrans and vrot are stored in a float32 array.
+    Queries are answered by multilinear interpolation between the grid points.
+
+    The controller changes steeply near some of the points where its membership
+    functions bend, and even jumps at some of them, so the grid is refined
+    around them until the interpolation is close to the controller (see
+    `REFINE_TOLERANCE`).
+
+    Since sampling the controller takes a while, the table is cached on disk,
+    keyed by a hash of the controller's parameters and of the grid.
+    """
+
+    # The names of the inputs, in the order the `evaluate` method takes them
+    INPUTS = ("left", "front", "right", "ang", "dist")
+
+    # The default number of grid points for every input, before the grid is
+    # refined
+    DEFAULT_GRID = {
+        "left": 5,
+        "front": 5,
+        "right": 5,
+        "ang": 9,
+        "dist": 11,
+    }
+
+    # The largest error of the interpolation between two grid points that is
+    # left when the grid is refined, as a share of the range of every output.
+    # A warning is logged if the error of the table exceeds it (see
+    # `error_report`)
+    REFINE_TOLERANCE = 0.02
+
+    # The number of random inputs the interpolation is checked on when the
+    # grid is refined, and the largest number of times an interval is split
+    REFINE_SAMPLES = 64
+    REFINE_ROUNDS = 16
+
+    # The distance next to a grid point (as a share of the domain of the input)
+    # at which a jump of the controller is looked for
+    JUMP_OFFSET = 1e-4
+
+    # The offsets of all of the corners of a grid cell
+    CORNERS = np.array(list(itertools.product((0, 1), repeat=len(INPUTS))))
+
+    # The number of grid points the controller is evaluated for at once when
+    # the table is built
+    BUILD_CHUNK = 2 ** 15
+
+    CACHE_DIR = "data/cache"
+
+    logger = log.create_logger(name="FuzzyLUT",
+                               level=log.LOG_INFO)
+
+    def __init__(self, flc=None, grid=None, cache_dir=CACHE_DIR):
+        """Load the lookup table from the cache or build it if it is missing.
+
+        Args:
+            flc (RobotFuzzySystem, optional): The controller to approximate.
+            Defaults to the shared controller (see `shared_fuzzy_system`).
+
+            grid (dict, optional): For every input name (see `INPUTS`), either
+            the number of points spread evenly over the domain of the input (to
+            which the points where its membership functions bend are added,
+            before the grid is refined), or the sorted coordinates of the 
+            points, which are used as they are. The inputs that are missing use
+            `DEFAULT_GRID`.
+
+            cache_dir (str, optional): The directory the tables are cached in.
+            If None, the table is not cached.
+        """
+
+        self.flc = flc if flc is not None else shared_fuzzy_system()
+
+        grid = self.DEFAULT_GRID | (grid or {})
+        self.axes = tuple(self.__get_axis(name, grid[name]) for name in self.INPUTS)
+        refined = [name for name in self.INPUTS if np.isscalar(grid[name])]
+
+        # The key of the table depends on the controller, on the grid and on
+        # how it is refined
+        key = hashlib.sha1(self.flc.fingerprint().encode())
+        for axis in self.axes:
+            key.update(axis.tobytes())
+        key.update(repr((refined, self.REFINE_TOLERANCE, self.REFINE_SAMPLES,
+                         self.REFINE_ROUNDS, self.JUMP_OFFSET)).encode())
+        self.key = key.hexdigest()[:16]
+
+        cache_file = None
+        if cache_dir is not None:
+            cache_file = os.path.join(cache_dir, f"flc_lut_{self.key}.npz")
+
+        if cache_file is not None and os.path.exists(cache_file):
+            with np.load(cache_file) as data:
+                self.axes = tuple(data[f"axis/{name}"] for name in self.INPUTS)
+                self.table = data["table"]
+        else:
+            self.axes = self.__refine(self.axes, refined)
+            self.table = self.__build()
+
+            if cache_file is not None:
+                os.makedirs(cache_dir, exist_ok=True)
+
+                # Write the table to a temporary file first, since other
+                # processes may be loading the same table at the same time
+                tmp_file = f"{cache_file[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+                np.savez(tmp_file, table=self.table,
+                         **{f"axis/{name}": axis for name, axis in zip(self.INPUTS, self.axes)})
+                os.replace(tmp_file, cache_file)
+
+        self.__check_error()
+
+    def __get_axis(self, name, points):
+        """Return the coordinates of the grid points for an input."""
+
+        if np.isscalar(points):
+            domain = getattr(self.flc, name)
+            axis = np.linspace(domain._low, domain._high, points)
+
+            # Add the points where the membership functions of the input bend,
+            # since the output of the controller changes the most around them
+            breakpoints = [x for term in domain._sets.values() 
+                           for x in self.__get_breakpoints(term.func)]
+            axis = np.unique(np.concatenate((axis, breakpoints)).clip(domain._low, domain._high))
+        else:
+            axis = np.asarray(points, dtype=float)
+
+        assert axis.ndim == 1 and len(axis) >= 2 and np.all(np.diff(axis) > 0), \
+                f"[FuzzyLookupTable] The grid for {name} has to be increasing"
+
+        return axis
+
+    @staticmethod
+    def __get_breakpoints(func):
+        """Return the points where a membership function bends."""
+
+        kind, *params = func.params
+
+        if kind == "linear":
+            m, b = params
+            return [-b / m, (1 - b) / m] if m != 0 else []
+        
+        # For a triangular membership function, the points are low, high and c
+        return params
+
+    def __get_tolerance(self):
+        """Returns the largest errors accepted for vtrans and vrot."""
+
+        return self.REFINE_TOLERANCE * np.array([self.flc.vtrans._high - self.flc.vtrans._low,
+                                                 self.flc.vrot._high - self.flc.vrot._low])
+
+    def __refine(self, axes, names):
+        """Add points to the axes of the given inputs, one input at a time, 
+        until the linear interpolation between two grid points is within the
+        tolerance of the controller on random inputs, and add points next to
+        the grid points where the controller jumps.
+
+        The random inputs are drawn with a fixed seed, so that a grid is always
+        refined the same way.
+
+        Returns:
+            tuple: The refined axes.
+        """
+
+        tolerance = self.__get_tolerance()
+        rng = np.random.default_rng(0)
+        axes = list(axes)
+
+        for j, name in enumerate(self.INPUTS):
+            if name not in names:
+                continue
+
+            samples = np.column_stack([rng.uniform(axis[0], axis[-1], self.REFINE_SAMPLES)
+                                       for axis in axes])
+            offset = self.JUMP_OFFSET * (axes[j][-1] - axes[j][0])
+
+            def evaluate(xs):
+                # The outputs for all of the samples, with the input set to 
+                # every one of the values
+                points = np.repeat(samples[None], len(xs), axis=0)
+                points[:, :, j] = xs[:, None]
+                outputs = self.flc.evaluate_batch(*points.reshape(-1, len(self.INPUTS)).T)
+
+                return np.column_stack(outputs).reshape(len(xs), self.REFINE_SAMPLES, 2)
+
+            def exceeds(outputs, expected):
+                # Whether an output is out of the tolerance for any sample, 
+                # where no rule was activated counts as no error
+                errors = np.nan_to_num(np.abs(outputs - expected)) / tolerance
+                return errors.max(axis=(1, 2)) > 1
+
+            for _ in range(self.REFINE_ROUNDS):
+                axis = axes[j]
+                low, high = axis[:-1], axis[1:]
+                mid = (low + high) / 2
+                low_outputs, high_outputs = evaluate(low), evaluate(high)
+
+                # Split the intervals whose middle is not close to the 
+                # interpolation of their ends
+                new_points = [mid[exceeds(evaluate(mid), (low_outputs + high_outputs) / 2)]]
+
+                # Add points right next to the ends where the controller jumps
+                wide = high - low > 2 * offset
+                for end_outputs, inner in ((low_outputs, low + offset),
+                                           (high_outputs, high - offset)):
+                    new_points.append(inner[wide & exceeds(evaluate(inner), end_outputs)])
+
+                new_points = np.concatenate(new_points)
+                if len(new_points) == 0:
+                    break
+
+                axes[j] = np.unique(np.concatenate((axis, new_points)))
+
+        return tuple(axes)
+
+    def __check_error(self):
+        """Log a warning if the table is not within the tolerance of the
+        controller."""
+
+        tolerance = self.__get_tolerance()
+        report = self.error_report(n_samples=2000)
+
+        for (name, errors), limit in zip(report.items(), tolerance):
+            if errors["p99"] > limit:
+                self.logger.warning(f"The lookup table is not accurate: the 99th percentile "
+                                    f"of the error of {name} is {errors['p99']:.3g}, above "
+                                    f"{limit:.3g}. Use a finer grid or the exact controller")
+
+    def __build(self):
+        """Sample the controller over the whole grid.
+
+        Returns:
+            numpy.ndarray: float32 array with one dimension for every input and
+            a last dimension holding vtrans and vrot. If no rule was activated
+            for a grid point, its values are NaN.
+        """
+
+        shape = tuple(len(axis) for axis in self.axes)
+        self.logger.info(f"Building the FLC lookup table over {np.prod(shape)} points")
+
+        table = np.empty((np.prod(shape), 2), dtype=np.float32)
+
+        # Evaluate the controller for chunks of grid points at once
+        for start in range(0, len(table), self.BUILD_CHUNK):
+            idx = np.unravel_index(np.arange(start, min(start + self.BUILD_CHUNK, len(table))), shape)
+            inputs = [axis[i] for axis, i in zip(self.axes, idx)]
+
+            table[start : start + self.BUILD_CHUNK] = np.column_stack(self.flc.evaluate_batch(*inputs))
+
+        return table.reshape(shape + (2,))
+
+    def interpolate(self, points):
+        """Multilinear interpolation of the table.
+
+        Args:
+            points (numpy.ndarray): Array of shape (n, 5), with one row of
+            inputs (in the order of `INPUTS`) for every query. The inputs that
+            are outside of the grid are clipped to it.
+
+        Returns:
+            numpy.ndarray: Array of shape (n, 2), holding vtrans and vrot for
+            every query.
+        """
+
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+
+        # For every input, get the index of the lower grid point and the
+        # position between the lower and the upper grid points
+        idxs = np.empty(points.shape, dtype=np.intp)
+        fracs = np.empty(points.shape)
+        for j, axis in enumerate(self.axes):
+            x = np.clip(points[:, j], axis[0], axis[-1])
+            i = np.clip(np.searchsorted(axis, x, side="right") - 1, 0, len(axis) - 2)
+
+            idxs[:, j] = i
+            fracs[:, j] = (x - axis[i]) / (axis[i + 1] - axis[i])
+
+        # Sum the values in all of the corners of the grid cells, weighted by
+        # how close the queries are to them
+        corner_idxs = idxs[:, None, :] + self.CORNERS
+        weights = np.where(self.CORNERS, fracs[:, None, :], 1 - fracs[:, None, :]).prod(axis=-1)
+        values = self.table[tuple(corner_idxs.transpose(2, 0, 1))]
+
+        return np.einsum("nc,nck->nk", weights, values)
+
+    def evaluate(self, inp_left, inp_front, inp_right, inp_ang, inp_dist):
+        """Approximate `RobotFuzzySystem.evaluate` for a single set of inputs.
+
+        Returns:
+            [float, float]: List containing the values for vtrans (translational
+            speed) and for vrot (rotational speed) in this order."""
+
+        vtrans, vrot = self.interpolate([inp_left, inp_front, inp_right,
+                                         inp_ang, inp_dist])[0]
+
+        return float(vtrans), float(vrot)
+
+    def evaluate_batch(self, inp_left, inp_front, inp_right, inp_ang, inp_dist):
+        """Approximate `RobotFuzzySystem.evaluate_batch` for many sets of inputs
+        at once.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray): The values for vtrans and vrot.
+        """
+
+        output = self.interpolate(np.column_stack((inp_left, inp_front, inp_right,
+                                                   inp_ang, inp_dist)))
+
+        return output[:, 0], output[:, 1]
+
+    def error_report(self, n_samples=10000, seed=0):
+        """Compare the table with the exact controller on random inputs drawn
+        uniformly from within the grid.
+
+        Args:
+            n_samples (int, optional): The number of random inputs.
+            seed (int, optional): The seed used for drawing the inputs.
+
+        Returns:
+            dict: For vtrans and vrot, the mean, the 99th percentile and the
+            maximum of the absolute errors.
+        """
+
+        rng = np.random.default_rng(seed)
+        points = np.column_stack([rng.uniform(axis[0], axis[-1], n_samples)
+                                  for axis in self.axes])
+
+        exact = np.column_stack(self.flc.evaluate_batch(*points.T))
+        errors = np.abs(self.interpolate(points) - exact)
+
+        return {
+            name: {
+                "mean": float(np.nanmean(errors[:, i])),
+                "p99": float(np.nanpercentile(errors[:, i], 99)),
+                "max": float(np.nanmax(errors[:, i])),
+            }
+            for i, name in enumerate(("vtrans", "vrot"))
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def shared_lookup_table():
+    """Return the `FuzzyLookupTable` with the default grid, shared by all of the
+    robots. It is loaded or built only once per process."""
+
+    return FuzzyLookupTable()
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+
+
+class Instrumentation:
+    """Accumulates the wall time and the number of calls of the phases of
+    `Simulation.step`: the physics steps, the sensor scans, the evaluations of
+    the fuzzy controller, the drawing and the computation of the reward.
+
+    It is opt-in: the simulation only measures the phases if it was given an
+    `Instrumentation`, so that it costs a single check per phase otherwise.
+    The values of every step are returned in the info dict of the step, and
+    the totals can be written periodically to a snapshot file.
+    """
+
+    PHASES = ("physics", "sensing", "flc", "drawing", "reward")
+
+    # The default number of steps between two snapshots
+    SNAPSHOT_EVERY = 1000
+
+    def __init__(self, snapshot_file=None, snapshot_every=SNAPSHOT_EVERY):
+        """
+        Args:
+            snapshot_file (str, optional): The JSON file the totals are written
+            to (see `snapshot`). If None, no snapshot is written.
+
+            snapshot_every (int, optional): The number of steps between two
+            snapshots. Defaults to `Instrumentation.SNAPSHOT_EVERY`.
+        """
+
+        self.snapshot_file = snapshot_file
+        self.snapshot_every = snapshot_every
+
+        self.reset()
+
+    def reset(self):
+        """Reset all of the totals."""
+
+        self.total_times = dict.fromkeys(self.PHASES, 0.0)
+        self.total_counts = dict.fromkeys(self.PHASES, 0)
+        self.steps = 0
+        self.substeps = 0
+        self.start_time = time.perf_counter()
+
+        self.__new_step()
+
+    def __new_step(self):
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.counts = dict.fromkeys(self.PHASES, 0)
+
+    def add(self, phase, duration, count=1):
+        """Add the duration (in seconds) of a number of calls of a phase to the
+        current step."""
+
+        self.times[phase] += duration
+        self.counts[phase] += count
+
+    def end_step(self, sim, substeps):
+        """Finish the current step of a simulation.
+
+        Args:
+            sim (Simulation): The simulation that took the step.
+            substeps (int): The number of sub-steps of the action.
+
+        Returns:
+            dict: The times (in seconds) and the number of calls of every phase
+            during the step, the number of sub-steps, the number of bodies and
+            shapes in the pymunk space, and the hits of the scans reused by the
+            sensors during the episode (see `SwarmController.get_sensor_stats`).
+        """
+
+        step = {
+            "times": self.times,
+            "counts": self.counts,
+            "substeps": substeps,
+            "bodies": len(sim.space.bodies),
+            "shapes": len(sim.space.shapes),
+            "sensor_cache": sim.swarm.get_sensor_stats(),
+        }
+
+        for phase in self.PHASES:
+            self.total_times[phase] += self.times[phase]
+            self.total_counts[phase] += self.counts[phase]
+
+        self.steps += 1
+        self.substeps += substeps
+        self.__new_step()
+
+        if self.snapshot_file is not None and self.steps % self.snapshot_every == 0:
+            self.write_snapshot(step)
+
+        return step
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: The totals since the last reset: the wall time, the number of
+            steps and sub-steps and, for every phase, the time, the number of
+            calls and the share of the wall time.
+        """
+
+        wall_time = time.perf_counter() - self.start_time
+
+        return {
+            "wall_time": wall_time,
+            "steps": self.steps,
+            "substeps": self.substeps,
+            "substeps_per_step": self.substeps / max(self.steps, 1),
+            "phases": {
+                phase: {
+                    "time": self.total_times[phase],
+                    "calls": self.total_counts[phase],
+                    "share": self.total_times[phase] / wall_time if wall_time > 0 else 0.0,
+                }
+                for phase in self.PHASES
+            },
+        }
+
+    def write_snapshot(self, last_step=None):
+        """Write the totals (and the values of the last step, if given) to the
+        snapshot file, replacing the old snapshot at once."""
+
+        snapshot = self.snapshot()
+        if last_step is not None:
+            snapshot["last_step"] = last_step
+
+        with open(self.snapshot_file + ".tmp", "w") as f:
+            json.dump(snapshot, f, indent=2)
+
+        os.replace(self.snapshot_file + ".tmp", self.snapshot_file)
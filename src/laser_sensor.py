@@ -1,20 +1,37 @@
 import math
+import functools
 import pygame
+import pymunk
 import numpy as np
 
 # Local imports
 import constants 
 
 
-# This class was based on the sensor.py module that can be found at:   
-# https://github.com/charleslf2/2D-simulation-of-Simulataneous-Localisation-And-Maping-SLAM-               
-class LaserSensor:
-    def __init__(self, range=400, n_readings=13, start_angle=-90, 
-                 angle_space=15, position=(0,0), body_angle=0, body_radius=10):
-        """Initialize the sensor.
+class SensorConfig:
+    """The configuration of a `LaserSensor`, which is read-only and can be 
+    shared by the sensors of any number of robots (see `shared_sensor_config`).
+    It also holds the tables that are precomputed from the geometry of the 
+    sensor."""
+
+    # The ways in which the sensor can find the obstacles. The "pixel" backend
+    # samples the colors of the rendered screen along each ray, while the 
+    # "raycast" backend queries the pymunk space directly and needs no display.
+    # The pixel backend only tells the obstacles from the background with
+    # `ignore_background`, in which case the two mostly agree, but the pixel
+    # readings are only as precise as the samples and see the arena as it was
+    # last drawn, so they differ from the raycast ones on a few rays (about 1 in
+    # 10 by more than 2 pixels)
+    BACKENDS = ("pixel", "raycast")
+
+    def __init__(self, range=400, n_readings=13, start_angle=-90, angle_space=15,
+                 body_radius=10, *, n_samples=150, backend="pixel", noise=True,
+                 noise_sigma=(0.5, 0.01), reuse_tolerance=None, adaptive_interval=None,
+                 far_distance=None, ignore_background=False):
+        """Initialize the configuration of the sensor.
 
         Args:
-            max_range (int, optional): The maximum range that the sensor can work 
+            range (int, optional): The maximum range that the sensor can work 
             at. By default the sensor works from 0 to 400 cm.
             
             n_readings  (int, optional): The number of angular readings performed
@@ -26,25 +43,182 @@ class LaserSensor:
             angle_space  (int, optional): The space in degrees between the 
             angular readings. Defaults to 15 (degrees).
 
-            position  ((int, int), optional): The position where the LaserSensor is 
-            placed on in the pymunk space.
-
-            body_angle  (int, optional): The orientation of the body that is 
-            to be placed on.
-
             body_radius (int, optional): The width of the body the sensor is placed
             on. It is assumed that the body has a circular shape.
+
+            n_samples (int, optional): The number of points checked along a ray
+            by the `"pixel"` backend. Defaults to 150.
+
+            backend (str, optional): Either `"pixel"` or `"raycast"`. Defaults
+            to `"pixel"`.
+
+            noise (bool, optional): Whether noise is added to the readings.
+            Defaults to True.
+
+            noise_sigma ((float, float), optional): The standard deviations of
+            the noise for the distance and for the angle of a reading.
+
+            reuse_tolerance ((float, float), optional): The distance and the 
+            angle (in radians) that the sensor and the dynamic bodies around it
+            can move by before the last scan is made again. If None, every 
+            reading is a new scan. Defaults to None.
+
+            adaptive_interval (int, optional): If given, a scan in which every
+            ray reads at least `far_distance` is also reused while nothing has
+            moved by more than the clearance left by its readings, for up to 
+            this number of readings, starting from one and doubling after every
+            such scan. It is only used with `reuse_tolerance`. Defaults to None.
+
+            far_distance (float, optional): The distance from which a ray reads
+            far for the adaptive mode. Defaults to 80% of the range.
+
+            ignore_background (bool, optional): Whether the `"pixel"` backend
+            only takes the colors other than the ones of the background, of the
+            nest and of the boundary as obstacles, and starts sampling past the
+            drawn body. Otherwise every pixel within the screen is an obstacle,
+            which is what the trained weights of the agents were trained with. 
+            Defaults to False.
         """
 
+        assert backend in self.BACKENDS, \
+                f"[SensorConfig] Unknown sensor backend: {backend}"
+
         self.range = range
         self.n_readings = n_readings
         self.start_angle = start_angle
         self.angle_space = angle_space  # Leave this amount of space between readings
+        self.body_radius = body_radius
+        self.n_samples = n_samples
+        self.backend = backend
+
+        # Parameters of the noise added to the readings
+        self.noise = noise
+        self.noise_sigma = self.__read_only(np.array(noise_sigma, dtype=float))
+
+        # Parameters of the reuse of the last scan
+        self.reuse_tolerance = reuse_tolerance
+        self.adaptive_interval = adaptive_interval
+        self.far_distance = far_distance if far_distance is not None else 0.8 * range
+
+        self.ignore_background = ignore_background
+
+        # Precompute the direction of every ray relative to the orientation of
+        # the body, as well as the relative positions of the samples on a ray
+        self.ray_angles = self.__read_only(start_angle + np.arange(n_readings) * angle_space)
+        self.ray_cos = self.__read_only(np.cos(np.radians(self.ray_angles)))
+        self.ray_sin = self.__read_only(np.sin(np.radians(self.ray_angles)))
+        self.samples_u = self.__read_only(np.arange(n_samples) / n_samples)
+
+    @staticmethod
+    def __read_only(array):
+        array.flags.writeable = False
+        return array
+
+
+@functools.lru_cache(maxsize=None)
+def shared_sensor_config(**params):
+    """Return the `SensorConfig` with the given parameters. It is created only 
+    once per process, and it is shared by all of the callers, so it must not be
+    modified."""
+
+    return SensorConfig(**params)
+
+
+def _get_body_extent(body):
+    """Returns the largest distance from the center of a body to the points of
+    its shapes, and whether its shapes change when it turns (i.e. if they are
+    not all circles centered on the body)."""
+
+    radius, turns = 0.0, False
+
+    for shape in body.shapes:
+        if isinstance(shape, pymunk.Circle):
+            radius = max(radius, shape.offset.length + shape.radius)
+            turns = turns or shape.offset.length > 0
+        elif isinstance(shape, pymunk.Segment):
+            radius = max(radius, max(shape.a.length, shape.b.length) + shape.radius)
+            turns = True
+        else:
+            radius = max(radius, max(v.length for v in shape.get_vertices()) + shape.radius)
+            turns = True
+
+    return radius, turns
+
+
+# This class was based on the sensor.py module that can be found at:   
+# https://github.com/charleslf2/2D-simulation-of-Simulataneous-Localisation-And-Maping-SLAM-               
+class LaserSensor:
+    # The number of pixels past the radius of the body where the "pixel"
+    # backend starts sampling with `ignore_background`, since the drawn disc of
+    # the body is rounded to whole pixels and would otherwise be seen as an
+    # obstacle
+    DRAWN_MARGIN = 2
+
+    def __init__(self, config=None, position=(0,0), body_angle=0, *, space=None, 
+                 shape=None, rng=None):
+        """Initialize the sensor.
+
+        Args:
+            config (SensorConfig, optional): The configuration of the sensor, 
+            which can be shared with other sensors. Defaults to the shared
+            configuration with the default parameters.
+
+            position  ((int, int), optional): The position where the LaserSensor is 
+            placed on in the pymunk space.
+
+            body_angle  (int, optional): The orientation of the body that is 
+            to be placed on.
+
+            space (pymunk.Space, optional): The space that is queried by the 
+            `"raycast"` backend, and whose dynamic bodies are tracked to reuse
+            the scans (see `get_reading`).
+
+            shape (pymunk.Shape, optional): The shape of the body the sensor is
+            placed on. It is ignored by the `"raycast"` backend.
+
+            rng (numpy.random.Generator, optional): The random generator used
+            for the noise. A seed can be given instead. Defaults to a freshly
+            seeded generator.
+        """
+
+        self.config = config if config is not None else shared_sensor_config()
+
+        assert self.config.backend != "raycast" or space is not None, \
+                "[LaserSensor] The raycast backend needs a pymunk space"
+        assert self.config.reuse_tolerance is None or space is not None, \
+                "[LaserSensor] Reusing the scans needs a pymunk space"
 
         # Body dependent parameters
         self.position = (position[0]+100, position[1])
         self.sensor_angle = body_angle
-        self.body_radius = body_radius
+
+        self.space = space
+        self.shape = shape
+
+        # The random generator for the noise added to the readings
+        self.rng = np.random.default_rng(rng)
+
+        # The distances of the last reading, e.g. for recording them
+        self.last_reading = None
+
+        # The distances of the last scan, before the noise is added, and the
+        # poses they were read from (see `get_reading`)
+        self.scan = None
+        self.scan_pose = None
+        self.scan_body_poses = None
+        self.scan_clearance = 0.0
+        self.scan_reuses = 0
+        self.scan_interval = 0
+
+        # The other dynamic bodies of the space, with their extents (see 
+        # `_get_body_extent`). They are only listed again when the number of
+        # bodies of the space changes
+        self.bodies = []
+        self.n_space_bodies = None
+
+        # The number of readings that reused the last scan (hits) and that made
+        # a new one (misses)
+        self.stats = {"hits": 0, "misses": 0}
 
         # Save the pygame surface of the arena
         self.screen = pygame.display.get_surface()
@@ -93,95 +267,261 @@ class LaserSensor:
     def get_reading(self):
         """Perform all of the angular readings along the sensor's axis and check 
         if an object was found.
+
+        If the configuration has a `reuse_tolerance`, the distances of the last
+        scan are reused as long as neither the sensor nor the dynamic bodies 
+        within its range moved by more than the tolerance. The noise is still 
+        drawn again for every reading.
         
-        Returns a list containing all angular readings.
+        Returns a list containing all angular readings."""
+
+        if self.config.reuse_tolerance is None:
+            distances = self.__scan()
+            self.stats["misses"] += 1
+        else:
+            if self.__can_reuse():
+                distances = self.scan
+                self.scan_reuses += 1
+                self.stats["hits"] += 1
+            else:
+                distances = self.__scan()
+                self.__save_scan(distances)
+                self.stats["misses"] += 1
+
+        angles = math.degrees(self.sensor_angle) + self.config.ray_angles
+        readings, _ = self.__add_noise(distances, angles)
+
+        # Return the coordinates of the obstacles or None if there isn't any
+        self.last_reading = readings.tolist() if len(readings) > 0 else None
         
-        Args:
-            obj_color (str): The color of the object to detect."""
+        return self.last_reading
+
+    def get_hit_rate(self):
+        """Returns the share of the readings that reused the last scan."""
+
+        total = self.stats["hits"] + self.stats["misses"]
+
+        return self.stats["hits"] / total if total > 0 else 0.0
+
+    def __scan(self):
+        if self.config.backend == "raycast":
+            return self.__get_reading_raycast()
+
+        return self.__get_reading_pixel()
+
+    def __get_bodies(self):
+        """Returns the other dynamic bodies of the space, with their extents."""
+
+        space_bodies = self.space.bodies
+
+        if len(space_bodies) != self.n_space_bodies:
+            own_body = self.shape.body if self.shape is not None else None
+
+            self.bodies = [(body, *_get_body_extent(body)) for body in space_bodies
+                           if body.body_type == pymunk.Body.DYNAMIC and body is not own_body]
+            self.n_space_bodies = len(space_bodies)
+
+        return self.bodies
+
+    def __can_reuse(self):
+        """Check if the last scan can be reused, given how far the sensor and
+        the dynamic bodies around it moved since it was made.
+
+        This runs for every reading, so it is written with scalar operations,
+        which are faster than numpy for the few bodies of the space.
+        """
+
+        bodies = self.__get_bodies()
+
+        if self.scan is None or len(bodies) != len(self.scan_body_poses):
+            return False
+
+        dist_tol, angle_tol = self.config.reuse_tolerance
+        x0, y0, angle0 = self.scan_pose
+
+        # The scan can not be reused at all if the sensor turned
+        if abs((self.sensor_angle - angle0 + math.pi) % (2 * math.pi) - math.pi) > angle_tol:
+            return False
+
+        # A scan where every ray read far can also be reused, as long as nothing
+        # got closer than the clearance left by its readings
+        adaptive = self.scan_reuses < self.scan_interval
+
+        x, y = self.position
+        displacement = math.hypot(x - x0, y - y0)
+        moved = displacement > dist_tol
+
+        if moved and not adaptive:
+            return False
+
+        max_dist = self.config.range + dist_tol
+
+        for (body, radius, turns), (bx0, by0, bangle0) in zip(bodies, self.scan_body_poses):
+            bx, by = body.position
+            body_moved = math.hypot(bx - bx0, by - by0)
+
+            # The turns of the circles centered on their body can be ignored
+            turned = abs((body.angle - bangle0 + math.pi) % (2 * math.pi) - math.pi) if turns else 0.0
+
+            # The points of a body move by at most its radius times its turn
+            displacement += body_moved + radius * turned
+
+            if body_moved <= dist_tol and turned <= angle_tol:
+                continue
+
+            # The bodies that can not be seen by the sensor, either now or when
+            # the scan was made, are ignored
+            if min(math.hypot(bx - x, by - y), math.hypot(bx0 - x0, by0 - y0)) - radius <= max_dist:
+                if not adaptive:
+                    return False
+
+                moved = True
+
+        return not moved or displacement <= self.scan_clearance
+
+    def __save_scan(self, distances):
+        self.scan = distances
+        self.scan_pose = (self.position[0], self.position[1], self.sensor_angle)
+        self.scan_body_poses = [(*body.position, body.angle) for body, _, _ in self.__get_bodies()]
+        self.scan_clearance = float(distances.min()) - self.config.far_distance
+        self.scan_reuses = 0
+
+        # In the adaptive mode, the scans are made less often while every ray
+        # reads far
+        if self.config.adaptive_interval is None or self.scan_clearance < 0:
+            self.scan_interval = 0
+        else:
+            self.scan_interval = min(max(2 * self.scan_interval, 1), 
+                                     self.config.adaptive_interval)
+
+    def __get_reading_pixel(self):
+        """Perform the angular readings by checking the color of the pixels
+        along each ray on the pygame screen.
+        
+        All of the sample points of all the rays are computed at once, and the
+        first sample that hits an obstacle is found for every ray.
+        
+        Returns the distances of the readings, without noise."""
         
         arena_w, arena_h = self.screen.get_size()
-        readings = []
 
-        for angle_idx in range(self.n_readings):
-            angle = math.degrees(self.sensor_angle) + self.start_angle + \
-                    angle_idx * self.angle_space
+        # Get the direction of every ray by rotating the precomputed ray
+        # directions with the orientation of the body
+        cos_body, sin_body = math.cos(self.sensor_angle), math.sin(self.sensor_angle)
+        ray_cos = cos_body * self.config.ray_cos - sin_body * self.config.ray_sin
+        ray_sin = sin_body * self.config.ray_cos + cos_body * self.config.ray_sin
+
+        # The first point on every ray that is not within the body and the
+        # extremity of every ray
+        start = self.config.body_radius
+        if self.config.ignore_background:
+            start += self.DRAWN_MARGIN
+
+        x_start = self.position[0] + start * ray_cos
+        y_start = self.position[1] + start * ray_sin
+        x_fin = self.position[0] + self.config.range * ray_cos
+        y_fin = self.position[1] + self.config.range * ray_sin
+
+        # The positions of all the samples along the rays, with one row per ray
+        u = self.config.samples_u
+        x_line = ((1-u) * x_start[:, None] + u * x_fin[:, None]).astype(np.intp)
+        y_line = ((1-u) * y_start[:, None] + u * y_fin[:, None]).astype(np.intp)
+
+        # Only the points that are still within the screen coordonates are valid
+        in_screen = (0 < x_line) & (x_line < arena_w) & (0 < y_line) & (y_line < arena_h)
+
+        if self.config.ignore_background:
+            # Get the color of every sample point at once, as colors mapped to
+            # the pixel format of the screen. The view on the pixels locks the
+            # surface, so it is released right after it is used
+            pixels = pygame.surfarray.pixels2d(self.screen)
+            colors = pixels[np.where(in_screen, x_line, 0), np.where(in_screen, y_line, 0)]
+            del pixels
+
+            # Every color other than the ones of the background, of the nest 
+            # and of the boundary is an obstacle
+            is_obstacle = (colors != self.screen.map_rgb(constants.COLOR["artichoke"])) & \
+                          (colors != self.screen.map_rgb(constants.COLOR["auburn"])) & \
+                          (colors != self.screen.map_rgb((0, 0, 0)))
+            hit = in_screen & is_obstacle
+        else:
+            # The original test of the colors holds for any color, so every
+            # sample within the screen is an obstacle
+            hit = in_screen
+
+        # Get the first sample that hit an obstacle for every ray
+        rays = np.arange(self.config.n_readings)
+        first = hit.argmax(axis=1)
+        found_object = hit[rays, first]
+
+        # If no object was found along a ray, the reading is the one at its 
+        # extremity
+        x_obj = np.where(found_object, x_line[rays, first], x_fin)
+        y_obj = np.where(found_object, y_line[rays, first], y_fin)
+        return np.sqrt((x_obj - self.position[0]) ** 2 + (y_obj - self.position[1]) ** 2)
+
+    def __get_reading_raycast(self):
+        """Perform the angular readings by querying the pymunk space along each
+        ray. The shape of the body the sensor is placed on is ignored.
+        
+        Returns the distances of the readings, without noise."""
+
+        distances = []
+
+        for angle_idx in range(self.config.n_readings):
+            angle = math.degrees(self.sensor_angle) + self.config.start_angle + \
+                    angle_idx * self.config.angle_space
             
             # Get the first point on the line that is not within the body
-            pos_start = self.__get_fin_pos(angle, self.body_radius)
+            pos_start = self.__get_fin_pos(angle, self.config.body_radius)
             
             # Get the position of the extremity of the ray
-            x_fin, y_fin = self.__get_fin_pos(angle, self.range)
-
-            # Flag used to check if an object was found for every reading
-            found_object = False
-
-            # Along the line of the ray, check if there is any object 
-            for i in range(0, 150):
-                u = i / 150
-
-                # Get the position on the line
-                x_line = int((1-u) * pos_start[0] + u * x_fin)
-                y_line = int((1-u) * pos_start[1] + u * y_fin)
-
-                # If the point is still within the screen coordonates
-                if 0 < x_line < arena_w and 0 < y_line < arena_h:
-                    # Get the color of the point 
-                    color = self.screen.get_at((x_line, y_line))
-                    
-                    # If the color represents the color of an obstacle
-                    if (color[0], color[1], color[2]) != constants.COLOR["artichoke"] or \
-                        (color[0], color[1], color[2]) != constants.COLOR["auburn"] or \
-                        (color[0], color[1], color[2]) != (0, 0, 0):
-                        found_object = True
-
-                        distance = self.__get_dist((x_line, y_line))
-                        obstacle_data = self.__add_noise(distance, angle)
-
-                        # Since an obstacle was found, add it to the list
-                        # Record the position the obstacle was found at 
-                        # and also the current position of the laser
-                        readings.insert(angle_idx, obstacle_data[0])
-                        
-                        break 
-            
-            if not found_object:
-                distance = self.__get_dist((x_fin, y_fin))
-                data = self.__add_noise(distance, angle)
+            pos_fin = self.__get_fin_pos(angle, self.config.range)
 
-                readings.insert(angle_idx, data[0])
-        
-        # Return the coordinates of the obstacles or None if there isn't any
-        return readings if len(readings) > 0 else None
+            # Get the closest shape along the ray, other than the body itself
+            hits = self.space.segment_query(pos_start, pos_fin, 0, pymunk.ShapeFilter())
+            hit = min((h for h in hits if h.shape is not self.shape), 
+                      key=lambda h: h.alpha, default=None)
+
+            if hit is not None:
+                distances.append(self.__get_dist(hit.point))
+            else:
+                distances.append(self.__get_dist(pos_fin))
+
+        return np.array(distances)
 
     def draw_sensor_angles(self):
-        for angle_idx in range(self.n_readings):
-            angle = math.degrees(self.sensor_angle) + self.start_angle + \
-                    angle_idx * self.angle_space
+        for angle_idx in range(self.config.n_readings):
+            angle = math.degrees(self.sensor_angle) + self.config.start_angle + \
+                    angle_idx * self.config.angle_space
             
             # Get the first point on the line that is not within the body
-            pos_start = self.__get_fin_pos(angle, self.body_radius)
+            pos_start = self.__get_fin_pos(angle, self.config.body_radius)
 
             # Get the position of the extremity of the ray
-            pos_fin = self.__get_fin_pos(angle, self.range)
+            pos_fin = self.__get_fin_pos(angle, self.config.range)
 
             # Draw a red line representing the ray
             pygame.draw.line(self.screen, (255, 0, 0), pos_start, pos_fin, 2)
     
-    def __add_noise(self, distance, angle):
-        """Return the distance and the angle of the detected object with noise
-        added to the measurement. This noise is simply a random value in the
-        vicinity of the actual measurement."""
+    def __add_noise(self, distances, angles):
+        """Return the distances and the angles of the detected objects for all 
+        of the rays with noise added to the measurements. This noise is simply
+        a random value in the vicinity of the actual measurement.
         
-        sigma = np.array([0.5, 0.01])
+        Since the distance and the angle noises are independent, the noise for
+        all of the rays is drawn at once from a normal distribution."""
 
-        mean = np.array([distance, angle])
-        cov = np.diag(sigma ** 2)
+        if not self.config.noise:
+            return distances, angles
+        
+        mean = np.stack((distances, angles))
 
         # Get the new measurements with the added noise
-        new_dist, new_angle = np.random.multivariate_normal(mean, cov)
+        new_dist, new_angle = self.rng.normal(mean, self.config.noise_sigma[:, None])
 
         # Clip to 0 if the values are negative
-        new_dist = max(new_dist, 0)
-        new_angle = max(new_angle, 0)
+        new_dist = np.maximum(new_dist, 0)
+        new_angle = np.maximum(new_angle, 0)
 
         return new_dist, new_angle
@@ -1,10 +1,16 @@
 import os
-import json
+import glob
 
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from dotenv import load_dotenv
 
+# Local imports
+from metrics import load_columns, per_step_average, rolling_mean
+from sweep import RESULT_FILE
+
 # Load the env variables
 load_dotenv()
 
@@ -12,28 +18,28 @@ def load_one(json_file_name):
     """
     Plot the accumulated reward for all of the episodes and the number of 
     steps per epsiode.
+
+    The file can be either a `.json` history or a `.jsonl` metrics stream (see
+    `load_columns`).
     """
 
-    with open(json_file_name) as json_file:
-        data = json.load(json_file)
-        x = [(i+1) for i in range(len(data['episode_reward']))]
+    import matplotlib.pyplot as plt
+
+    data = load_columns(json_file_name)
+    x = np.arange(1, len(data['episode_reward']) + 1)
 
-        total_reward = []
-        sum = 0
-        for reward in data['episode_reward']:
-            sum += reward 
-            total_reward.append(sum)
+    total_reward = np.cumsum(data['episode_reward'])
 
-        plt.figure(1)
-        plt.plot(x, total_reward)
-        plt.xlabel('Episode number')
-        plt.ylabel('Accumulated reward')
+    plt.figure(1)
+    plt.plot(x, total_reward)
+    plt.xlabel('Episode number')
+    plt.ylabel('Accumulated reward')
 
-        plt.figure(2)
-        plt.plot(x, data['nb_episode_steps'])
-        plt.xlabel('Episode number')
-        plt.ylabel('Number steps per episode')
-        plt.show()
+    plt.figure(2)
+    plt.plot(x, data['nb_episode_steps'])
+    plt.xlabel('Episode number')
+    plt.ylabel('Number steps per episode')
+    plt.show()
 
 
 def load_200():
@@ -44,29 +50,19 @@ def load_200():
     Plot the reward per epsiode and the number of steps per episode.
     """
 
+    import matplotlib.pyplot as plt
+
     json_dqn = str(os.getenv("JSON_DQN_200K"))
     json_srs = str(os.getenv("JSON_SRS_200K"))
 
-    with open(json_dqn) as json_file:
-        data_dqn = json.load(json_file)
-
-    with open(json_srs) as json_file:
-        data_srs = json.load(json_file)
-
-    x_dqn = [(i+1) for i in range(len(data_dqn['episode_reward']))]
-    x_srs = [(i+1) for i in range(len(data_srs['episode_reward']))]
+    data_dqn = load_columns(json_dqn)
+    data_srs = load_columns(json_srs)
 
-    total_reward_dqn = []
-    sum_dqn = 0
-    for reward in data_dqn['episode_reward']:
-        sum_dqn += reward 
-        total_reward_dqn.append(sum_dqn)
+    x_dqn = np.arange(1, len(data_dqn['episode_reward']) + 1)
+    x_srs = np.arange(1, len(data_srs['episode_reward']) + 1)
 
-    total_reward_srs = []
-    sum_srs = 0
-    for reward in data_srs['episode_reward']:
-        sum_srs += reward 
-        total_reward_srs.append(sum_srs)
+    total_reward_dqn = np.cumsum(data_dqn['episode_reward'])
+    total_reward_srs = np.cumsum(data_srs['episode_reward'])
 
     fig, axs = plt.subplots(1, 2)
 
@@ -88,44 +84,141 @@ def load_200():
     plt.show()
 
 
-def load_swarms_data():
-    """Load data for different swarm configurations, from 2 to 5 robots."""
+def find_runs(pattern):
+    """Return the run files matching a glob pattern, or the metrics files in a
+    directory (the `.json` and `.jsonl` files, other than the results of the
+    jobs of a sweep)."""
+
+    if not os.path.isdir(pattern):
+        return sorted(glob.glob(pattern))
 
-    json_2 = os.getenv("JSON_2_ROBOTS")
-    json_3 = os.getenv("JSON_3_ROBOTS")
-    json_4 = os.getenv("JSON_4_ROBOTS")
-    json_5 = os.getenv("JSON_5_ROBOTS")
+    paths = glob.glob(os.path.join(pattern, "*.json")) + glob.glob(os.path.join(pattern, "*.jsonl"))
 
-    with open(json_2) as json_file:
-        data_2 = json.load(json_file)
+    return sorted(path for path in paths if os.path.basename(path) != RESULT_FILE)
 
-    with open(json_3) as json_file:
-        data_3 = json.load(json_file)
 
-    with open(json_4) as json_file:
-        data_4 = json.load(json_file)
+def load_runs(pattern, max_workers=None):
+    """Load the columns of all of the runs matching a pattern (see `find_runs`)
+    in parallel, with one process per file.
 
-    with open(json_5) as json_file:
-        data_5 = json.load(json_file)
+    Returns:
+        list: The columns of every run (see `load_columns`).
+    """
 
-    x_2 = [(i+1) for i in range(len(data_2['episode_reward']))]
-    x_3 = [(i+1) for i in range(len(data_3['episode_reward']))]
-    x_4 = [(i+1) for i in range(len(data_4['episode_reward']))]
-    x_5 = [(i+1) for i in range(len(data_5['episode_reward']))]
+    paths = find_runs(pattern)
+    assert paths, f"[load_runs] No run matches {pattern}"
+
+    # A single file is loaded directly, without starting a pool
+    if len(paths) == 1:
+        return [load_columns(paths[0])]
+
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(load_columns, paths))
+
+
+def aggregate_runs(runs, column, percentiles=(10, 90), cumulative=False):
+    """Align the episodes of many runs and compute the statistics of a column
+    for every episode over the runs.
+
+    The runs are aligned by their episode number. The shorter runs are padded
+    with NaN, so the statistics of the later episodes only use the runs that
+    got that far.
+
+    Args:
+        runs (list): The columns of every run (see `load_runs`).
+        column (str): The name of the column (e.g. `"episode_reward"`).
+
+        percentiles ((float, float), optional): The percentiles of the lower
+        and upper bounds of the band. Defaults to (10, 90).
+
+        cumulative (bool, optional): Whether the values are summed over the 
+        episodes of every run first. Defaults to False.
+
+    Returns:
+        dict: The episode numbers (`"x"`), and the `"mean"`, `"median"`, 
+        `"low"` and `"high"` values and the number of runs (`"n_runs"`) for
+        every episode.
+    """
+
+    n_episodes = max(len(run[column]) for run in runs)
+
+    values = np.full((len(runs), n_episodes), np.nan)
+    for i, run in enumerate(runs):
+        values[i, :len(run[column])] = np.cumsum(run[column]) if cumulative else run[column]
+
+    low, high = np.nanpercentile(values, percentiles, axis=0)
+
+    return {
+        "x": np.arange(1, n_episodes + 1),
+        "mean": np.nanmean(values, axis=0),
+        "median": np.nanmedian(values, axis=0),
+        "low": low,
+        "high": high,
+        "n_runs": np.sum(~np.isnan(values), axis=0),
+    }
+
+
+def plot_aggregate(ax, stats, label=None):
+    """Plot the median of aggregated runs (see `aggregate_runs`), with the 
+    band between the percentiles."""
+
+    line, = ax.plot(stats["x"], stats["median"], label=label)
+    ax.fill_between(stats["x"], stats["low"], stats["high"], 
+                    color=line.get_color(), alpha=0.25, linewidth=0)
 
-    fig, axs = plt.subplots(2, 2, sharey=True)
 
-    axs[0, 0].plot(x_2, data_2["nb_steps"])
-    axs[0, 0].set_title("2-robot formation")
+def compare_groups(groups, column="episode_reward", percentiles=(10, 90), 
+                   cumulative=False):
+    """Plot the runs of many configurations on the same axes.
 
-    axs[0, 1].plot(x_3, data_3["nb_steps"])
-    axs[0, 1].set_title("3-robot formation")
+    Args:
+        groups (dict): For every configuration, its label and the pattern of 
+        its runs (see `find_runs`).
 
-    axs[1, 0].plot(x_4, data_4["nb_steps"])
-    axs[1, 0].set_title("4-robot formation")
+        column (str, optional): The column that is compared. Defaults to
+        `"episode_reward"`.
 
-    axs[1, 1].plot(x_5, data_5['nb_steps'])
-    axs[1, 1].set_title("5-robot formation")
+        percentiles ((float, float), optional): The bounds of the bands. 
+        Defaults to (10, 90).
+
+        cumulative (bool, optional): Whether the values are summed over the 
+        episodes of every run. Defaults to False.
+    """
+
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+
+    for label, pattern in groups.items():
+        runs = load_runs(pattern)
+        stats = aggregate_runs(runs, column, percentiles, cumulative)
+
+        plot_aggregate(ax, stats, label=f"{label} ({len(runs)} runs)")
+
+    ax.set(xlabel='Episode number', ylabel=column)
+    ax.legend()
+
+    fig.tight_layout()
+    plt.show()
+
+
+def load_swarms_data():
+    """Load data for different swarm configurations, from 2 to 5 robots.
+
+    Every environment variable can hold a single run file, or a directory or 
+    a glob pattern of the runs of many seeds, in which case the median and 
+    the band between the 10th and the 90th percentiles are plotted.
+    """
+
+    import matplotlib.pyplot as plt
+
+    fig, axs = plt.subplots(2, 2, sharey=True)
+
+    for ax, n_robots in zip(axs.flat, (2, 3, 4, 5)):
+        runs = load_runs(os.getenv(f"JSON_{n_robots}_ROBOTS"))
+
+        plot_aggregate(ax, aggregate_runs(runs, "nb_steps"))
+        ax.set_title(f"{n_robots}-robot formation")
 
     for ax in axs.flat:
         ax.set(xlabel='Episode number', ylabel='Steps per episode')
@@ -138,26 +231,42 @@ def load_swarms_data():
     plt.show()
 
 
-def load():
+def load(window=None):
+    """
+    Plot the average reward per step and the number of steps of every episode,
+    for random actions and for the DQN and the deep SARSA RL algorithms.
+
+    Args:
+        window (int, optional): If given, the values are smoothed with a 
+        rolling mean over this number of episodes.
+    """
+
+    import matplotlib.pyplot as plt
+
     json_rnd = os.getenv("JSON_RND")
     json_dqn = os.getenv("JSON_DQN")
     json_srs = os.getenv("JSON_SRS")
     
-    with open(json_rnd) as json_file:
-        data_rnd = json.load(json_file)
-    
-    with open(json_dqn) as json_file:
-        data_dqn = json.load(json_file)
-
-    with open(json_srs) as json_file:
-        data_srs = json.load(json_file)
-
-    x_rnd = [(i+1) for i in range(len(data_rnd['episode_reward']))]
-    reward_avg_rnd = [data_rnd['episode_reward'][i]/data_rnd['nb_episode_steps'][i] for i in range(len(data_rnd['episode_reward']))]
-    x_dqn = [(i+1) for i in range(len(data_dqn['episode_reward']))]
-    reward_avg_dqn = [data_rnd['episode_reward'][i]/data_dqn['nb_episode_steps'][i] for i in range(len(data_dqn['episode_reward']))]
-    x_srs = [(i+1) for i in range(len(data_srs['episode_reward']))]
-    reward_avg_srs = [data_srs['episode_reward'][i]/data_srs['nb_episode_steps'][i] for i in range(len(data_srs['episode_reward']))]
+    data_rnd = load_columns(json_rnd)
+    data_dqn = load_columns(json_dqn)
+    data_srs = load_columns(json_srs)
+
+    x_rnd = np.arange(1, len(data_rnd['episode_reward']) + 1)
+    reward_avg_rnd = per_step_average(data_rnd['episode_reward'], data_rnd['nb_episode_steps'])
+    x_dqn = np.arange(1, len(data_dqn['episode_reward']) + 1)
+    reward_avg_dqn = per_step_average(data_dqn['episode_reward'], data_dqn['nb_episode_steps'])
+    x_srs = np.arange(1, len(data_srs['episode_reward']) + 1)
+    reward_avg_srs = per_step_average(data_srs['episode_reward'], data_srs['nb_episode_steps'])
+
+    steps_rnd = data_rnd['nb_episode_steps']
+    steps_dqn = data_dqn['nb_episode_steps']
+    steps_srs = data_srs['nb_episode_steps']
+
+    if window is not None:
+        reward_avg_rnd, reward_avg_dqn, reward_avg_srs = \
+            (rolling_mean(r, window) for r in (reward_avg_rnd, reward_avg_dqn, reward_avg_srs))
+        steps_rnd, steps_dqn, steps_srs = \
+            (rolling_mean(s, window) for s in (steps_rnd, steps_dqn, steps_srs))
 
     fig, axs = plt.subplots(3, 2, sharey="col")
 
@@ -170,13 +279,13 @@ def load():
     axs[2, 0].plot(x_srs, reward_avg_srs)
     axs[2, 0].set_title("SARSA RL method")
 
-    axs[0, 1].plot(x_rnd, data_rnd['nb_episode_steps'])
+    axs[0, 1].plot(x_rnd, steps_rnd)
     axs[0, 1].set_title("Random actions")
 
-    axs[1, 1].plot(x_dqn, data_dqn['nb_episode_steps'])
+    axs[1, 1].plot(x_dqn, steps_dqn)
     axs[1, 1].set_title("DQN RL method")
     
-    axs[2, 1].plot(x_srs, data_srs['nb_episode_steps'])
+    axs[2, 1].plot(x_srs, steps_srs)
     axs[2, 1].set_title("SARSA RL method")
 
     labels = ['Average reward', 'Steps per episode', 
@@ -1,5 +1,8 @@
 import sys
+import queue
+import atexit
 import logging 
+import logging.handlers
 
 LOG_FORMAT = logging.Formatter('[%(asctime)s] %(levelname)-8s %(name)-10s %(message)s')
 
@@ -11,16 +14,51 @@ LOG_INFO = logging.INFO
 LOG_DEBUG = logging.DEBUG
 LOG_NONSET = logging.NOTSET
 
+# The handler shared by all of the loggers, which only puts the records in a 
+# queue, and the listener that writes them to stdout from a background thread
+_queue_handler = None
+_listener = None
+
+
+def _get_queue_handler():
+    """Return the handler shared by all of the loggers, and start the listener
+    thread the first time it is needed."""
+
+    global _queue_handler, _listener
+
+    if _queue_handler is None:
+        log_queue = queue.Queue()
+
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(LOG_FORMAT)
+
+        _listener = logging.handlers.QueueListener(log_queue, console_handler)
+        _listener.start()
+
+        # Write the remaining records before the interpreter exits
+        atexit.register(_listener.stop)
+
+        _queue_handler = logging.handlers.QueueHandler(log_queue)
+
+    return _queue_handler
+
+
 def create_logger(name, level=logging.DEBUG):
+    """Return the logger with the given name. The records are written to stdout
+    by a background thread, so that logging never blocks on the console. 
+    
+    The handler is only added once, so the function can be called again for 
+    the same logger (e.g. by every instance of a class)."""
+
     # Create the logger
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
-    # Add a console handler for this logger
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(LOG_FORMAT)
-    logger.addHandler(console_handler)
+    # Add the queue handler for this logger
+    handler = _get_queue_handler()
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
 
     logger.propagate = False
 
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,153 @@
+"""Run the simulation, train or test an agent, or plot the metrics of runs.
+
+Run from the `src` folder, e.g.
+
+    python main.py random --headless --max-steps 1000
+    python main.py train --agent dqn --headless --checkpoint-dir data/checkpoints/dqn
+    python main.py test --agent sarsa --weights models/sarsa_weights.h5f
+    python main.py plot data/sarsa_data.jsonl
+
+The modules of every command are only imported when it runs, so that the
+commands that do not need TensorFlow or matplotlib start quickly.
+"""
+
+import argparse
+
+# Local imports
+import constants
+
+
+def add_sim_arguments(parser):
+    """Add the arguments of the `Simulation` shared by the commands that run
+    it."""
+
+    parser.add_argument("--headless", action="store_true",
+                        help="Run without a window and without the frame limiter")
+    parser.add_argument("--swarm-size", type=int, default=constants.ROBOTS_NUMBER)
+    parser.add_argument("--sensor-backend", choices=["pixel", "raycast"], default="pixel")
+    parser.add_argument("--flc-engine", choices=["exact", "lut"], default="exact")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--max-ep-steps", type=int, default=constants.MAX_EP_STEPS,
+                        help="The maximum number of steps of an episode")
+    parser.add_argument("--out", default="data",
+                        help="The directory of the metrics file")
+
+
+def get_sim_kwargs(args):
+    return {
+        "headless": args.headless,
+        "swarm_size": args.swarm_size,
+        "sensor_backend": args.sensor_backend,
+        "flc_engine": args.flc_engine,
+    }
+
+
+def get_runner(agent):
+    import episodes
+
+    return episodes.run_episodes_dqn if agent == "dqn" else episodes.run_episodes_sarsa
+
+
+def run_random(args):
+    import episodes
+
+    metrics_file = episodes.run_random(max_steps=args.max_steps,
+                                       max_episode_steps=args.max_ep_steps,
+                                       seed=args.seed,
+                                       sim_kwargs=get_sim_kwargs(args),
+                                       output_dir=args.out)
+    print(f"Metrics written to {metrics_file}")
+
+
+def train(args):
+    metrics_file = get_runner(args.agent)(nb_steps=args.nb_steps,
+                                          learning_rate=args.learning_rate,
+                                          max_episode_steps=args.max_ep_steps,
+                                          seed=args.seed,
+                                          sim_kwargs=get_sim_kwargs(args),
+                                          output_dir=args.out,
+                                          models_dir=args.models_dir,
+                                          checkpoint_dir=args.checkpoint_dir,
+                                          checkpoint_interval=args.checkpoint_interval,
+                                          resume=args.resume)
+    print(f"Metrics written to {metrics_file}")
+
+
+def test(args):
+    metrics_file = get_runner(args.agent)("test",
+                                          max_episode_steps=args.max_ep_steps,
+                                          seed=args.seed,
+                                          sim_kwargs=get_sim_kwargs(args),
+                                          output_dir=args.out,
+                                          weights_file=args.weights)
+    print(f"Metrics written to {metrics_file}")
+
+
+def plot(args):
+    import os
+    import load_stats
+
+    if not args.runs:
+        load_stats.load(window=args.window)
+    elif len(args.runs) == 1 and os.path.isfile(args.runs[0]):
+        load_stats.load_one(args.runs[0])
+    else:
+        load_stats.compare_groups({pattern: pattern for pattern in args.runs},
+                                  column=args.column,
+                                  cumulative=args.cumulative)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    # random
+    random_parser = commands.add_parser("random", help="Run the simulation with random actions")
+    add_sim_arguments(random_parser)
+    random_parser.add_argument("--max-steps", type=int, default=35000)
+    random_parser.set_defaults(func=run_random)
+
+    # train
+    train_parser = commands.add_parser("train", help="Train a DQN or a SARSA agent")
+    add_sim_arguments(train_parser)
+    train_parser.add_argument("--agent", choices=["dqn", "sarsa"], default="sarsa")
+    train_parser.add_argument("--nb-steps", type=int, default=200000)
+    train_parser.add_argument("--learning-rate", type=float, default=3e-4)
+    train_parser.add_argument("--models-dir", default="models",
+                              help="The directory the trained weights are saved in")
+    train_parser.add_argument("--checkpoint-dir", default=None,
+                              help="The directory the training is checkpointed in")
+    train_parser.add_argument("--checkpoint-interval", type=int, default=None,
+                              help="The number of steps between two checkpoints")
+    train_parser.add_argument("--resume", action="store_true",
+                              help="Continue from the latest checkpoint")
+    train_parser.set_defaults(func=train)
+
+    # test
+    test_parser = commands.add_parser("test", help="Test the trained weights of an agent")
+    add_sim_arguments(test_parser)
+    test_parser.add_argument("--agent", choices=["dqn", "sarsa"], default="sarsa")
+    test_parser.add_argument("--weights", default=None,
+                             help="The weights tested, defaults to the reference run")
+    test_parser.set_defaults(func=test)
+
+    # plot
+    plot_parser = commands.add_parser("plot", help="Plot the metrics of runs")
+    plot_parser.add_argument("runs", nargs="*",
+                             help="A metrics file, or the patterns of the runs compared "
+                                  "(see `load_stats.find_runs`). If none, the runs of "
+                                  "the environment variables are plotted")
+    plot_parser.add_argument("--column", default="episode_reward",
+                             help="The column compared between the runs")
+    plot_parser.add_argument("--cumulative", action="store_true")
+    plot_parser.add_argument("--window", type=int, default=None,
+                             help="The window of the rolling mean of the default plot")
+    plot_parser.set_defaults(func=plot)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import hashlib
+
+import numpy as np
+
+
+class MetricsWriter:
+    """Append-only stream of metrics in the JSON Lines format, with one record
+    (e.g. one episode) per line.
+
+    The records are written as soon as they are given, and the file is flushed
+    periodically, so a crash loses at most the last few records and the memory
+    used does not grow with the length of the run.
+    """
+
+    # The file is flushed after this many records, or after this many seconds
+    FLUSH_EVERY = 10
+    FLUSH_INTERVAL = 5
+
+    def __init__(self, path, flush_every=FLUSH_EVERY, flush_interval=FLUSH_INTERVAL):
+        """Open the stream, appending to the file if it already exists.
+
+        Args:
+            path (str): The `.jsonl` file the records are written to.
+
+            flush_every (int, optional): The number of records after which the
+            file is flushed. Defaults to `MetricsWriter.FLUSH_EVERY`.
+
+            flush_interval (float, optional): The number of seconds after which
+            the file is flushed. Defaults to `MetricsWriter.FLUSH_INTERVAL`.
+        """
+
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+
+        # Start on a new line if the last record of the file was truncated
+        truncated = False
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                truncated = f.read(1) != b"\n"
+
+        self.file = open(path, "a")
+        if truncated:
+            self.file.write("\n")
+
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, record):
+        """Write a record, given as a dict."""
+
+        self.file.write(json.dumps(record, default=_to_builtin) + "\n")
+        self.pending += 1
+
+        if self.pending >= self.flush_every \
+                or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self.pending = 0
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _to_builtin(value):
+    """Convert the numpy values in a record, which `json` can not serialize."""
+
+    if isinstance(value, np.generic):
+        return value.item()
+
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def read_metrics(path):
+    """Read a metrics file, either a JSON Lines stream written by
+    `MetricsWriter` or a JSON file holding the whole history of a run.
+
+    The lines that can not be parsed (e.g. a record truncated by a crash) are
+    skipped.
+
+    Returns:
+        dict: For every key of the records, the list of its values.
+    """
+
+    with open(path) as f:
+        if not path.endswith(".jsonl"):
+            return json.load(f)
+
+        records = []
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    keys = dict.fromkeys(key for record in records for key in record)
+
+    return {key: [record.get(key) for record in records] for key in keys}
+
+
+def truncate_metrics(path, n_episodes):
+    """Keep only the records of the first episodes of a metrics stream, e.g. 
+    the ones that ended before the checkpoint a run is resumed from.
+
+    The file is rewritten to a temporary file first, which then replaces it at
+    once, so that a crash can not lose the records that are kept.
+
+    Args:
+        path (str): The `.jsonl` file written by `MetricsWriter`.
+        n_episodes (int): The records whose episode is lower are kept.
+    """
+
+    if not os.path.exists(path):
+        return
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(path) as f, open(tmp_path, "w") as tmp:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            if record.get("episode", n_episodes) < n_episodes:
+                tmp.write(line if line.endswith("\n") else line + "\n")
+
+    os.replace(tmp_path, path)
+
+
+# The directory the column stores of the metrics files are cached in
+CACHE_DIR = "data/cache"
+
+# The entry of a column store that holds the version of the metrics file it
+# was made from
+CACHE_KEY = "__key__"
+
+
+def load_columns(path, cache_dir=CACHE_DIR):
+    """Load the numeric columns of a metrics file (see `read_metrics`) as numpy
+    arrays.
+
+    The file is only parsed the first time, after which its columns are kept in
+    a `.npz` file in the cache directory. There is a single one for every path,
+    which also holds the time the file was last modified and its size, and is
+    overwritten once the file changes.
+
+    Args:
+        path (str): The metrics file.
+
+        cache_dir (str, optional): The directory of the cached columns. If
+        None, the file is parsed every time. Defaults to `CACHE_DIR`.
+
+    Returns:
+        dict: For every numeric key of the records, the float array of its
+        values, where the missing values are NaN.
+    """
+
+    cache_file = None
+    if cache_dir is not None:
+        stat = os.stat(path)
+        name = hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+        cache_file = os.path.join(cache_dir, f"metrics_{name}.npz")
+        cache_key = f"{stat.st_mtime_ns}:{stat.st_size}"
+
+        if os.path.exists(cache_file):
+            with np.load(cache_file) as data:
+                if CACHE_KEY in data.files and str(data[CACHE_KEY]) == cache_key:
+                    return {key: data[key] for key in data.files if key != CACHE_KEY}
+
+    columns = {}
+    for key, values in read_metrics(path).items():
+        try:
+            columns[key] = np.array([np.nan if v is None else v for v in values], dtype=float)
+        except (TypeError, ValueError):
+            # Skip the columns that are not numeric
+            continue
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # Write the columns to a temporary file first, since other processes
+        # may be loading the same file at the same time
+        tmp_file = f"{cache_file[:-len('.npz')]}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_file, **columns, **{CACHE_KEY: np.array(cache_key)})
+        os.replace(tmp_file, cache_file)
+
+    return columns
+
+
+def per_step_average(rewards, steps):
+    """Returns the average reward per step of every episode."""
+
+    return np.asarray(rewards, dtype=float) / np.asarray(steps, dtype=float)
+
+
+def rolling_mean(values, window):
+    """Returns the means of the values over a sliding window. The first values
+    are averaged over the values seen so far."""
+
+    values = np.asarray(values, dtype=float)
+    cumsum = np.cumsum(values)
+
+    means = np.empty_like(values)
+    means[:window] = cumsum[:window] / np.arange(1, min(window, len(values)) + 1)
+    means[window:] = (cumsum[window:] - cumsum[:-window]) / window
+
+    return means
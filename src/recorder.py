@@ -0,0 +1,384 @@
+import os
+import sys
+import json
+import math
+import queue
+import threading
+
+import numpy as np
+import pygame
+
+# Local imports
+import constants
+import log
+
+
+class _Column:
+    """A column of the recorded data, with one row for every step, stored in a
+    memory-mapped file that is grown when it is full."""
+
+    def __init__(self, path, row_shape, dtype, capacity):
+        self.path = path
+        self.row_shape = tuple(row_shape)
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+
+        self.data = np.memmap(path, dtype=self.dtype, mode="w+",
+                              shape=(capacity,) + self.row_shape)
+
+    def write(self, start, rows):
+        """Write the rows starting at the given step, growing the file if they
+        do not fit."""
+
+        end = start + len(rows)
+        if end > self.capacity:
+            self.__resize(max(2 * self.capacity, end))
+
+        self.data[start:end] = rows
+
+    def close(self, n_rows):
+        """Flush the column and shrink the file to the rows that were written."""
+
+        self.__resize(n_rows)
+        self.data = None
+
+    def __resize(self, capacity):
+        self.data.flush()
+        self.data = None
+
+        row_size = self.dtype.itemsize * int(np.prod(self.row_shape))
+        with open(self.path, "r+b") as f:
+            f.truncate(capacity * row_size)
+
+        self.capacity = capacity
+
+        if capacity > 0:
+            self.data = np.memmap(self.path, dtype=self.dtype, mode="r+",
+                                  shape=(capacity,) + self.row_shape)
+
+
+class TrajectoryRecorder:
+    """Streams the trajectories of the episodes of a `Simulation` to a
+    directory, with one memory-mapped file for every column of data.
+
+    For every step, the poses of the robots and of the target, the action, the
+    reward, the done flag and the sensor readings the action was computed from
+    are recorded. The index of the episodes (the step each of them starts at,
+    its seed and the position of the homebase) is kept in `meta.json`.
+
+    The rows are written on a background thread, so recording a step only costs
+    copying its data into a queue. The files are preallocated and their size
+    is doubled when they are full.
+    """
+
+    META_FILE = "meta.json"
+
+    # The number of steps the files are preallocated for
+    INITIAL_CAPACITY = 4096
+
+    # The maximum number of steps waiting to be written. The step loop is only
+    # blocked if the writer falls this far behind
+    QUEUE_SIZE = 8192
+
+    # The number of seconds between two checks that the writer is still alive,
+    # while the queue is full
+    PUT_TIMEOUT = 1.0
+
+    logger = log.create_logger(name="Recorder",
+                               level=log.LOG_INFO)
+
+    def __init__(self, path, capacity=INITIAL_CAPACITY, queue_size=QUEUE_SIZE):
+        """Create the directory of the recording and start the writer thread.
+
+        Args:
+            path (str): The directory the files are written to.
+
+            capacity (int, optional): The number of steps the files are
+            preallocated for. Defaults to `TrajectoryRecorder.INITIAL_CAPACITY`.
+
+            queue_size (int, optional): The maximum number of steps waiting to
+            be written. Defaults to `TrajectoryRecorder.QUEUE_SIZE`.
+        """
+
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.capacity = capacity
+
+        self.meta = {"n_steps": 0, "columns": {}, "episodes": []}
+        self.columns = None
+
+        # The exception that stopped the writer thread, if any
+        self.error = None
+
+        self.__queue = queue.Queue(maxsize=queue_size)
+        self.__writer = threading.Thread(target=self.__write_loop, daemon=True)
+        self.__writer.start()
+
+    def start_episode(self, sim):
+        """Start a new episode, after the simulation was reset."""
+
+        target_vertices = np.array(sim.target.get_vertices())
+
+        self.__put(("episode", {
+            "seed": int(sim.episode_seed),
+            "goal_pos": [float(x) for x in sim.goal_pos],
+            "screen_size": [int(x) for x in sim.screen_size],
+            "robot_radius": sim.swarm.robots[0].RADIUS,
+            "target_length": float(np.ptp(target_vertices[:, 0])),
+        }))
+
+    def record(self, sim, action, reward, done):
+        """Record a step of the simulation, after it was taken."""
+
+        robots = sim.swarm.robots
+        target = sim.target.body
+
+        readings = np.array([robot.sensor.last_reading
+                             if robot.sensor.last_reading is not None else np.nan
+                             for robot in robots], dtype=np.float32)
+
+        self.__put(("step", {
+            "robot_pose": np.array([(r.body.position[0], r.body.position[1], r.body.angle)
+                                    for r in robots], dtype=np.float32),
+            "target_pose": np.array((target.position[0], target.position[1], target.angle),
+                                    dtype=np.float32),
+            "action": np.uint8(action),
+            "reward": np.float32(reward),
+            "done": np.bool_(done),
+            "readings": readings,
+        }))
+
+    def close(self):
+        """Write the remaining steps and stop the writer thread.
+
+        Raises:
+            RuntimeError: If the writer failed, in which case the recording is
+            incomplete.
+        """
+
+        if self.__writer.is_alive():
+            self.__put(None)
+            self.__writer.join()
+
+        self.__check_writer()
+
+    def __put(self, item):
+        """Queue an item for the writer, raising if the writer failed instead
+        of waiting for it forever."""
+
+        while True:
+            self.__check_writer()
+
+            try:
+                self.__queue.put(item, timeout=self.PUT_TIMEOUT)
+                return
+            except queue.Full:
+                if not self.__writer.is_alive():
+                    self.__check_writer()
+                    raise RuntimeError("[TrajectoryRecorder] The writer thread stopped")
+
+    def __check_writer(self):
+        if self.error is not None:
+            raise RuntimeError(f"[TrajectoryRecorder] Writing to {self.path} failed") \
+                  from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __write_loop(self):
+        """The main loop of the writer thread. An exception is kept, to be
+        raised by `record` and `close`, since it can not be raised here."""
+
+        try:
+            self.__write_batches()
+        except Exception as e:
+            self.error = e
+            self.logger.error(f"Writing to {self.path} failed: {e!r}")
+
+    def __write_batches(self):
+        """Write the steps waiting in the queue in batches, until the recorder
+        is closed."""
+
+        while True:
+            items = [self.__queue.get()]
+
+            while len(items) < self.QUEUE_SIZE:
+                try:
+                    items.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            steps = []
+            for item in items:
+                if item is None or item[0] == "episode":
+                    self.__write_steps(steps)
+                    steps = []
+
+                if item is None:
+                    self.__finish()
+                    return
+
+                kind, data = item
+
+                if kind == "episode":
+                    self.meta["episodes"].append({"start": self.meta["n_steps"]} | data)
+                    self.__write_meta()
+                else:
+                    steps.append(data)
+
+            self.__write_steps(steps)
+
+    def __write_steps(self, steps):
+        if not steps:
+            return
+
+        # The columns are created once the shapes of the rows are known
+        if self.columns is None:
+            self.columns = {
+                name: _Column(os.path.join(self.path, f"{name}.bin"),
+                              np.shape(value), np.asarray(value).dtype, self.capacity)
+                for name, value in steps[0].items()
+            }
+
+            self.meta["columns"] = {
+                name: {"shape": list(column.row_shape), "dtype": column.dtype.str}
+                for name, column in self.columns.items()
+            }
+
+        start = self.meta["n_steps"]
+        for name, column in self.columns.items():
+            column.write(start, np.stack([step[name] for step in steps]))
+
+        self.meta["n_steps"] += len(steps)
+
+    def __finish(self):
+        if self.columns is not None:
+            for column in self.columns.values():
+                column.close(self.meta["n_steps"])
+
+        self.__write_meta()
+        self.logger.info(f"Recorded {self.meta['n_steps']} steps in {self.path}")
+
+    def __write_meta(self):
+        """Write the index of the recording, replacing the old one at once so
+        that a reader never sees a partial file."""
+
+        meta_file = os.path.join(self.path, self.META_FILE)
+
+        with open(meta_file + ".tmp", "w") as f:
+            json.dump(self.meta, f)
+
+        os.replace(meta_file + ".tmp", meta_file)
+
+
+class TrajectoryReader:
+    """Lazy reader of a recording written by `TrajectoryRecorder`. The columns
+    are memory-mapped, so only the rows that are accessed are read from disk.
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, TrajectoryRecorder.META_FILE)) as f:
+            self.meta = json.load(f)
+
+        self.path = path
+        self.n_steps = self.meta["n_steps"]
+        self.episodes = self.meta["episodes"]
+        self.columns = {}
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def __getitem__(self, name):
+        """Return a whole column, with one row for every step."""
+
+        if name not in self.columns:
+            spec = self.meta["columns"][name]
+            shape = (self.n_steps,) + tuple(spec["shape"])
+
+            if self.n_steps > 0:
+                self.columns[name] = np.memmap(os.path.join(self.path, f"{name}.bin"),
+                                               dtype=np.dtype(spec["dtype"]),
+                                               mode="r", shape=shape)
+            else:
+                self.columns[name] = np.empty(shape, dtype=np.dtype(spec["dtype"]))
+
+        return self.columns[name]
+
+    def episode(self, idx):
+        """Return the index entry of an episode (see `TrajectoryRecorder`), with
+        its rows of every column added as views."""
+
+        start = self.episodes[idx]["start"]
+        end = self.episodes[idx + 1]["start"] if idx + 1 < len(self.episodes) else self.n_steps
+
+        return self.episodes[idx] | {name: self[name][start:end]
+                                     for name in self.meta["columns"]}
+
+
+def view_episode(recording, episode=0, fps=constants.FPS):
+    """Draw a recorded episode with pygame, without simulating it again.
+
+    Args:
+        recording (TrajectoryReader or str): The recording, or its directory.
+        episode (int, optional): The index of the episode. Defaults to 0.
+
+        fps (int, optional): The number of steps drawn every second. If None,
+        the steps are drawn as fast as possible. Defaults to constants.FPS.
+    """
+
+    if not isinstance(recording, TrajectoryReader):
+        recording = TrajectoryReader(recording)
+
+    ep = recording.episode(episode)
+
+    pygame.init()
+    screen = pygame.display.set_mode(ep["screen_size"])
+    pygame.display.set_caption(f"Foraging Task - episode {episode} (seed {ep['seed']})")
+    clock = pygame.time.Clock()
+
+    goal_x, goal_y = ep["goal_pos"]
+    half = ep["target_length"] / 2
+    radius = ep["robot_radius"]
+
+    for robot_pose, target_pose in zip(ep["robot_pose"], ep["target_pose"]):
+        # Finish the replay when a key/button is pressed
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                sys.exit(0)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                sys.exit(0)
+
+        screen.fill(constants.COLOR["artichoke"])
+
+        # Draw the homebase flag
+        pygame.draw.polygon(surface=screen,
+                            color=constants.COLOR["auburn"],
+                            points=((goal_x+25, goal_y),(goal_x, goal_y+7),(goal_x, goal_y-7)))
+
+        pygame.draw.circle(surface=screen,
+                           color=constants.COLOR["auburn"],
+                           center=(goal_x+12, goal_y),
+                           radius=constants.HOME_NEST_AREA,
+                           width=1)
+
+        # Draw the target as a rotated square
+        x, y, angle = target_pose.tolist()
+        cos_a, sin_a = math.cos(angle), math.sin(angle)
+        corners = [(x + dx * cos_a - dy * sin_a, y + dx * sin_a + dy * cos_a)
+                   for dx, dy in ((-half, -half), (half, -half), (half, half), (-half, half))]
+        pygame.draw.polygon(screen, constants.COLOR["hunter-green"], corners)
+
+        # Draw the robots and their heading
+        for x, y, angle in robot_pose.tolist():
+            pygame.draw.circle(screen, constants.COLOR["grey"], (x, y), radius)
+            pygame.draw.line(screen, constants.COLOR["black"], (x, y),
+                             (x + radius * math.cos(angle), y + radius * math.sin(angle)))
+
+        pygame.display.flip()
+
+        if fps is not None:
+            clock.tick(fps)
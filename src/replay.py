@@ -0,0 +1,117 @@
+import json
+
+import numpy as np
+
+# Local imports
+from sim import Simulation
+
+
+class ActionLog:
+    """The compact record of an episode of a `Simulation`, from which the
+    episode can be run again exactly (see `replay`).
+
+    Since the scenario and the sensor noise of an episode are derived from its
+    seed (see `Simulation.seed`), only the seed, the position of the homebase,
+    the parameters of the simulation and the actions are stored. The actions
+    take one byte per step.
+    """
+
+    def __init__(self, seed, goal_pos, actions, sim_kwargs=None):
+        """
+        Args:
+            seed (int): The seed of the episode (see `Simulation.reset`).
+            goal_pos ((int, int)): The position of the homebase.
+            actions (list): The actions taken during the episode.
+
+            sim_kwargs (dict, optional): The parameters the `Simulation` was
+            created with, which change the outcome of the episode.
+        """
+
+        self.seed = int(seed)
+        self.goal_pos = tuple(int(x) for x in goal_pos)
+        self.actions = np.asarray(actions, dtype=np.uint8)
+        self.sim_kwargs = sim_kwargs or {}
+
+    def __len__(self):
+        return len(self.actions)
+
+    @classmethod
+    def from_simulation(cls, sim):
+        """Return the log of the current episode of a simulation."""
+
+        sim_kwargs = {
+            "screen_size": tuple(sim.screen_size),
+            "headless": sim.headless,
+            "sensor_backend": sim.sensor_backend,
+            "sensor_noise": sim.sensor_noise,
+            "flc_engine": sim.flc_engine,
+            "max_substeps": sim.max_substeps,
+            "swarm_size": sim.swarm_size,
+            "sensor_params": sim.sensor_params,
+        }
+
+        return cls(sim.episode_seed, sim.goal_pos, sim.episode_actions, sim_kwargs)
+
+    def save(self, path):
+        """Save the log in a compressed `.npz` file."""
+
+        np.savez_compressed(path,
+                            seed=np.uint64(self.seed),
+                            goal_pos=np.array(self.goal_pos),
+                            actions=self.actions,
+                            sim_kwargs=np.array(json.dumps(self.sim_kwargs)))
+
+    @classmethod
+    def load(cls, path):
+        """Load a log saved with `save`."""
+
+        with np.load(path) as data:
+            return cls(seed=data["seed"],
+                       goal_pos=data["goal_pos"],
+                       actions=data["actions"],
+                       sim_kwargs=json.loads(str(data["sim_kwargs"])))
+
+
+def replay(action_log, *, headless=None, **sim_kwargs):
+    """Run an episode again from its log.
+
+    Args:
+        action_log (ActionLog or str): The log of the episode, or the path of
+        the file it was saved in.
+
+        headless (bool, optional): Whether the simulation is run without a
+        window (see `Simulation`). Defaults to the mode the episode was run in,
+        or to True for the logs that do not hold it.
+
+        sim_kwargs: Parameters of the `Simulation` that override the ones saved
+        in the log.
+
+    Returns:
+        (numpy.ndarray, numpy.ndarray, numpy.ndarray): The observations
+        (starting with the one returned on reset), the rewards and the done
+        flags of the episode.
+    """
+
+    if not isinstance(action_log, ActionLog):
+        action_log = ActionLog.load(action_log)
+
+    sim_kwargs = {"headless": True} | action_log.sim_kwargs | sim_kwargs
+
+    if headless is not None:
+        sim_kwargs["headless"] = headless
+
+    sim = Simulation(goal_pos=action_log.goal_pos, **sim_kwargs)
+
+    observations = [sim.reset(seed=action_log.seed)]
+    rewards, dones = [], []
+
+    for action in action_log.actions:
+        observation, reward, done, _ = sim.step(int(action))
+
+        observations.append(observation)
+        rewards.append(reward)
+        dones.append(done)
+
+    sim.close()
+
+    return np.array(observations), np.array(rewards), np.array(dones)
@@ -1,21 +1,31 @@
+import os
 import sys
+import time
 import random
 import math
 
+import numpy as np
 import pygame
 import pymunk
 import pymunk.pygame_util
 
-from rl.core import Env
-
 # Local imports
 import constants
 import log
 
 from srobot import SRobot
+from fuzzy import shared_fuzzy_system
+from fuzzy_lut import shared_lookup_table
 from swarm import SwarmController, SwarmState
 
-class Simulation(Env):
+class Simulation:
+    """The environment of the swarm, which implements the interface of the
+    keras-rl `Env` (`step`, `reset`, `render`, `close` and `seed`).
+
+    It does not inherit from it, since importing keras-rl imports TensorFlow,
+    which would slow down every process that only runs the simulation.
+    """
+
     OBSERVATION_SPACE_N = 5
     ACTION_SPACE_N = 2
     DAMPING = 0.05
@@ -23,29 +33,108 @@ class Simulation(Env):
     action_space = ACTION_SPACE_N
     observation_space = OBSERVATION_SPACE_N
 
-    def __init__(self, screen_size=constants.SCREEN_SIZE):
+    def __init__(self, screen_size=constants.SCREEN_SIZE, *, headless=False,
+                 sensor_backend="pixel", sensor_noise=True, flc_engine="exact",
+                 max_substeps=SwarmController.MAX_SUBSTEPS, seed=None, goal_pos=None,
+                 recorder=None, swarm_size=constants.ROBOTS_NUMBER, sensor_params=None,
+                 frame_rate=constants.FPS, instrumentation=None):
         """Initialize the simulation.
 
         Args:
             screen_size ((int, int), optional): The size of the surface. Defaults 
             to constants.SCREEN_SIZE.
+
+            headless (bool, optional): If True, no window is opened (the dummy
+            video driver is used), nothing is rendered on screen and the frame
+            limiter is disabled, so the simulation steps as fast as possible.
+            Defaults to False.
+
+            sensor_backend (str, optional): The backend used by the laser 
+            sensors of the robots, either `"pixel"` or `"raycast"` (see 
+            `SensorConfig`). Defaults to `"pixel"`.
+
+            sensor_noise (bool, optional): Whether noise is added to the sensor
+            readings. It can be turned off for benchmark runs. Defaults to True.
+
+            flc_engine (str, optional): Either `"exact"`, in which case the 
+            robots evaluate the fuzzy controller, or `"lut"`, in which case
+            they use a `FuzzyLookupTable` approximating the controller. 
+            Defaults to `"exact"`.
+
+            max_substeps (int, optional): The maximum number of sub-steps 
+            (physics steps) an action can take before it is aborted. If None,
+            the actions are not bounded. Defaults to 
+            `SwarmController.MAX_SUBSTEPS`.
+
+            seed (int, optional): The seed of the random streams of the 
+            simulation (see `seed`). Defaults to None.
+
+            goal_pos ((int, int), optional): The position of the homebase. If 
+            None, it is drawn at random. Defaults to None.
+
+            recorder (TrajectoryRecorder, optional): If given, every step is
+            recorded by it (see `recorder.py`). Defaults to None.
+
+            swarm_size (int, optional): The number of robots in the swarm. 
+            Defaults to constants.ROBOTS_NUMBER.
+
+            sensor_params (dict, optional): The parameters of the laser sensors
+            that are changed from `SRobot.SENSOR_PARAMS` (e.g. `n_readings` or
+            `n_samples`, see `SensorConfig`). Defaults to None.
+
+            frame_rate (int, optional): The maximum number of frames drawn 
+            every second when the simulation is not headless. If None, the 
+            frames are not limited. Defaults to constants.FPS.
+
+            instrumentation (Instrumentation, optional): If given, the phases of
+            every step are timed and counted by it, and their values are added
+            to the info dict of the step (see `instrumentation.py`). Defaults
+            to None.
         """
 
+        assert flc_engine in ("exact", "lut"), \
+                f"[Simulation] Unknown FLC engine: {flc_engine}"
+
+        self.headless = headless
+        self.sensor_backend = sensor_backend
+        self.sensor_noise = sensor_noise
+        self.flc_engine = flc_engine
+        self.max_substeps = max_substeps
+        self.recorder = recorder
+        self.swarm_size = swarm_size
+        self.sensor_params = sensor_params or {}
+        self.frame_rate = frame_rate
+        self.instr = instrumentation
+
+        # The configuration of the sensors and the fuzzy controller are shared
+        # by all of the robots
+        self.sensor_config = SRobot.get_sensor_config(backend=sensor_backend,
+                                                      noise=sensor_noise,
+                                                      **self.sensor_params)
+        self.flc = shared_lookup_table() if flc_engine == "lut" else shared_fuzzy_system()
+
+        # In headless mode no window is needed, so use the dummy video driver.
+        # This has to be set before pygame (and its display) is initialized
+        if self.headless:
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+
         # Initialize the game
         pygame.init()
 
         # Save the dimension of the surface
         self.screen_size = screen_size
 
-        # Set the screen dimensions
+        # Set the screen dimensions. In headless mode this is an offscreen 
+        # surface that the pixel based sensors can still read from
         self.screen = pygame.display.set_mode(self.screen_size)
 
-        # Set the title of the simulation
-        pygame.display.set_caption("Foraging Task")
-        self.clock = pygame.time.Clock()
+        if not self.headless:
+            # Set the title of the simulation
+            pygame.display.set_caption("Foraging Task")
+            self.clock = pygame.time.Clock()
 
-        # Set the font for the informational text
-        self.font = pygame.font.SysFont("Arial", 12)
+            # Set the font for the informational text
+            self.font = pygame.font.SysFont("Arial", 12)
 
         # Considering the screen variable above, the space would occupy
         # this whole screen and would have a dimension equal to the one
@@ -59,8 +148,11 @@ class Simulation(Env):
         # Declare the optional attributes of the space
         self.draw_options = pymunk.pygame_util.DrawOptions(self.screen)
 
+        # Create the random streams of the simulation
+        self.seed(seed)
+
         # Add the homebase 
-        self.goal_pos = self.get_homebase_pos()
+        self.goal_pos = self.get_homebase_pos(goal_pos)
 
         # Initialize the logger 
         self.logger = log.create_logger(name=self.__class__.__name__,
@@ -69,13 +161,71 @@ class Simulation(Env):
         # Create every object in the simulation
         self.reset()
     
-    def reset(self):
-        """On reset, the robots and the target are placed in the starting positions."""
+    def seed(self, seed=None):
+        """Seed the random streams of the simulation.
+
+        Every episode gets its own seed, drawn from this one, from which two
+        independent streams are derived: one for generating the scenario (the
+        position of the target) and one for the noise of the sensors of the
+        robots. An episode can thus be run again given only its seed (see 
+        `reset`) and its actions.
+
+        Args:
+            seed (int, optional): If None, fresh entropy is taken from the OS.
+
+        Returns:
+            [int]: The seeds used, as expected by keras-rl.
+        """
+
+        seed_seq = np.random.SeedSequence(seed)
+        self.__seed_rng = np.random.default_rng(seed_seq)
+
+        # The scenario stream used before the first episode (e.g. for the 
+        # position of the homebase)
+        self.scenario_rng = random.Random(int(self.__seed_rng.integers(2**63)))
+
+        return [seed_seq.entropy]
+
+    def get_rng_state(self):
+        """Returns the state of the stream the seeds of the episodes are drawn
+        from, so that a training run can be resumed with the same episodes (see
+        `set_rng_state`)."""
+
+        return self.__seed_rng.bit_generator.state
+
+    def set_rng_state(self, state):
+        """Restore the state returned by `get_rng_state`. It applies from the
+        next reset."""
+
+        self.__seed_rng.bit_generator.state = state
+
+    def reset(self, seed=None):
+        """On reset, the robots and the target are placed in the starting positions.
         
+        Args:
+            seed (int, optional): The seed of the episode. If None, it is drawn
+            from the seed of the simulation (see `seed`). Defaults to None.
+        """
+        
+        # Create the random streams of the episode
+        if seed is None:
+            seed = int(self.__seed_rng.integers(2**63))
+
+        scenario_seq, noise_seq = np.random.SeedSequence(seed).spawn(2)
+
+        self.episode_seed = seed
+        self.scenario_rng = random.Random(int(scenario_seq.generate_state(1)[0]))
+
+        # The actions taken during the episode
+        self.episode_actions = []
+
         # Remove all bodies from the space
         for shape in self.space.shapes:
             self.space.remove(shape)
 
+        for body in self.space.bodies:
+            self.space.remove(body)
+
         # Add the target again
         self.target = self.add_target()
 
@@ -85,7 +235,15 @@ class Simulation(Env):
                                      sim_space=self.space,
                                      goal_pos=self.goal_pos,
                                      target=self.target,
-                                     swarm_size=3)
+                                     swarm_size=self.swarm_size,
+                                     sensor_config=self.sensor_config,
+                                     max_substeps=self.max_substeps,
+                                     flc=self.flc,
+                                     rng=noise_seq,
+                                     instrumentation=self.instr)
+
+        if self.recorder is not None:
+            self.recorder.start_episode(self)
 
         return self.__get_state_vars()
     
@@ -104,71 +262,139 @@ class Simulation(Env):
         pass
     
     def close(self):
-        pass
+        """Close the recorder of the simulation, if it has one, so that all of
+        the recorded steps are written."""
 
-    def step(self, action):
+        if self.recorder is not None:
+            self.recorder.close()
+
+    def step(self, action, avg_vel=None):
         """Advance the simulation one step given an action.
         
         Args:
             action (int): Can be one of the three options: 0 = tras, 1 = rot, 
             3 = sca. NOTE: the scaling action is not implemented.
+
+            avg_vel ((float, float), optional): The average velocities of the
+            robots for this action, if they were already computed (see
+            `SwarmController.run`).
+
+        Returns:
+            (list, float, bool, dict): The new state, the reward, whether the
+            episode is done and an info dict holding the number of sub-steps
+            the action took as `"substeps"`, and the values measured during the
+            step as `"instrumentation"` if the simulation is instrumented.
         """
 
         assert (action in [0, 1, 2]), \
                 "[Simulation.step] Given action is not recognized"
 
+        self.episode_actions.append(action)
+
         last_pos = self.swarm.position  # Save the last position of the swarm 
         last_target = self.target.body.position  # Save the last position of the target
 
+        # Draw the arena for the pixel sensors to read before the action is
+        # started. This is also done when there is a window, since the screen
+        # then still holds the frame of the last sub-step (with the stats text)
+        # or the one of the previous episode, so that both modes sense the same
+        # pixels
+        if self.sensor_backend == "pixel":
+            if self.instr is not None:
+                start = time.perf_counter()
+
+            self.__draw_arena()
+
+            if self.instr is not None:
+                self.instr.add("drawing", time.perf_counter() - start)
+
         # Perform the given action
-        self.swarm.run(action)
+        self.swarm.run(action, avg_vel=avg_vel)
+        substeps = 0
 
         while self.swarm.state != SwarmState.NONE:
-            # Finish the execution of the game when a key/button is pressed
-            for event in pygame.event.get():
-                if event.type == pygame.QUIT:
-                    sys.exit(0)
-                elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
-                    sys.exit(0)
+            if not self.headless:
+                # Finish the execution of the game when a key/button is pressed
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        sys.exit(0)
+                    elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
+                        sys.exit(0)
+
+            # Let the swarm set the velocities of the robots, then advance the
+            # simulation with exactly one step
+            self.swarm.run()
 
-            # Advance the simulation with one step
-            self.space.step(1/constants.FPS) 
+            if self.instr is not None:
+                start = time.perf_counter()
 
-            self.swarm.run()
+            self.space.step(1/constants.FPS)
+            substeps += 1
 
-            # Make the background green
-            self.screen.fill(constants.COLOR["artichoke"])
-            
-            self.space.debug_draw(self.draw_options)
+            if self.instr is not None:
+                self.instr.add("physics", time.perf_counter() - start)
 
-            # Draw the homebase flag     
-            goal_x, goal_y = self.goal_pos                   
-            pygame.draw.polygon(surface=self.screen, 
-                                color=constants.COLOR["auburn"], 
-                                points=((goal_x+25, goal_y),(goal_x, goal_y+7),(goal_x, goal_y-7)))
+            if not self.headless:
+                if self.instr is not None:
+                    start = time.perf_counter()
 
-            pygame.draw.circle(surface=self.screen,
-                               color=constants.COLOR["auburn"],
-                               center=(self.goal_pos[0]+12, self.goal_pos[1]),
-                               radius=constants.HOME_NEST_AREA,
-                               width=1)
+                self.__draw_arena()
 
-            # Render the text 
-            self.__render_stats()
+                # Render the text 
+                self.__render_stats()
 
-            pygame.display.flip()
-            self.clock.tick(constants.FPS)
+                pygame.display.flip()
+
+                if self.instr is not None:
+                    self.instr.add("drawing", time.perf_counter() - start)
+
+                if self.frame_rate is not None:
+                    self.clock.tick(self.frame_rate)
 
         # Compute the reward
+        if self.instr is not None:
+            start = time.perf_counter()
+
         reward = self.__get_reward(last_pos, self.swarm.position, last_target)
 
+        if self.instr is not None:
+            self.instr.add("reward", time.perf_counter() - start)
+
         # Check if the swarm managed to bring the target food object into the nest
         done = self.__get_done_status()
 
         new_state = self.__get_state_vars()
 
-        return new_state, reward, done, {}
+        if self.recorder is not None:
+            self.recorder.record(self, action, reward, done)
+
+        info = {"substeps": substeps}
+
+        if self.instr is not None:
+            info["instrumentation"] = self.instr.end_step(self, substeps)
+
+        return new_state, reward, done, info
     
+    def __draw_arena(self):
+        """Draw the space and the homebase on the pygame screen."""
+
+        # Make the background green
+        self.screen.fill(constants.COLOR["artichoke"])
+        
+        self.space.debug_draw(self.draw_options)
+
+        # Draw the homebase flag     
+        goal_x, goal_y = self.goal_pos                   
+        pygame.draw.polygon(surface=self.screen, 
+                            color=constants.COLOR["auburn"], 
+                            points=((goal_x+25, goal_y),(goal_x, goal_y+7),(goal_x, goal_y-7)))
+
+        pygame.draw.circle(surface=self.screen,
+                           color=constants.COLOR["auburn"],
+                           center=(self.goal_pos[0]+12, self.goal_pos[1]),
+                           radius=constants.HOME_NEST_AREA,
+                           width=1)
+
     def __render_stats(self):
         """Render the relevant stats on the pygame screen."""
         
@@ -336,8 +562,8 @@ class Simulation(Env):
         # if the position is not given
         if position is None:
             h, w = self.screen_size
-            x = random.randint(w/5, w - (2 * w/5))  # 50, 420
-            y = random.randint((w/5 + w/25), w - (2 * w/5))  # 120, 300
+            x = self.scenario_rng.randint(w/5, w - (2 * w/5))  # 50, 420
+            y = self.scenario_rng.randint((w/5 + w/25), w - (2 * w/5))  # 120, 300
         else:
             x, y = position
 
@@ -364,8 +590,8 @@ class Simulation(Env):
         # if the position is not given
         if position is None:
             h, w = self.screen_size
-            x = random.randint(w/5+w/25, w/2)  # 120, 100
-            y = random.randint(w - w/5, w - (w/5 - w/25))  # 400, 420
+            x = self.scenario_rng.randint(w/5+w/25, w/2)  # 120, 100
+            y = self.scenario_rng.randint(w - w/5, w - (w/5 - w/25))  # 400, 420
         else:
             x, y = position
 
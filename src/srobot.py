@@ -7,8 +7,8 @@ from pymunk.vec2d import Vec2d
 import constants
 import log
 
-from laser_sensor import LaserSensor
-from fuzzy import RobotFuzzySystem
+from laser_sensor import LaserSensor, shared_sensor_config
+from fuzzy import shared_fuzzy_system
 
 
 class SRobot: 
@@ -17,7 +17,36 @@ class SRobot:
     logger =  log.create_logger(name="Robot",
                                 level=log.LOG_INFO)
 
-    def __init__(self, space, start_pos, start_angle):
+    # The parameters of the laser sensor attached to every robot
+    SENSOR_PARAMS = {
+        "range": 400,
+        "n_readings": 32,
+        "start_angle": -90,
+        "angle_space": 6,
+        "body_radius": RADIUS,
+    }
+
+    def __init__(self, space, start_pos, start_angle, *, sensor_config=None, 
+                 flc=None, rng=None):
+        """Create a robot and add it to the space.
+
+        The configuration of the sensor and the fuzzy controller are read-only,
+        so they are shared by all of the robots by default, and only the pose
+        of the robot and the random generator of its sensor noise are specific
+        to it.
+
+        Args:
+            sensor_config (SensorConfig, optional): The configuration of the 
+            laser sensor. Defaults to `SRobot.get_sensor_config()`.
+
+            flc (RobotFuzzySystem, optional): The fuzzy controller. It can also
+            be e.g. a `FuzzyLookupTable` approximating the controller. Defaults
+            to the controller shared by all robots.
+
+            rng (numpy.random.Generator, optional): The random generator of the
+            sensor noise, or a seed for it.
+        """
+        
         # Save the space the robots are going to be placed in
         self.space = space
 
@@ -27,33 +56,33 @@ class SRobot:
                                           start_angle=start_angle)
 
         # Attach a LaserSensor to it
-        self.sensor = LaserSensor(position=start_pos, body_angle=self.body.angle,
-                                  n_readings=32, start_angle=-90,
-                                  angle_space=6, range=400)
+        if sensor_config is None:
+            sensor_config = self.get_sensor_config()
+
+        self.sensor = LaserSensor(config=sensor_config, position=start_pos, 
+                                  body_angle=self.body.angle, space=space,
+                                  shape=self.shape, rng=rng)
 
         # Attach the fuzzy controller to it
-        self.flc = RobotFuzzySystem()
+        self.flc = flc if flc is not None else shared_fuzzy_system()
+
+    @classmethod
+    def get_sensor_config(cls, **params):
+        """Return the shared configuration of the robots' sensors, with the 
+        given parameters changed from `SRobot.SENSOR_PARAMS`."""
+
+        return shared_sensor_config(**(cls.SENSOR_PARAMS | params))
     
     def move(self, vtras):
-        self.space.step(1/constants.FPS)
-
         dv = Vec2d(vtras, 0.0)
         self.body.velocity = self.body.rotation_vector.cpvrotate(dv)
 
-        # Update the position of the sensor
-        self.sensor.update_position(self.body.position, self.body.angle)
-
     def stop_move(self):
         # Reset the velocity
         self.body.velocity = 0, 0
 
         # Reset the angular velocity
         self.body.angular_velocity = 0
-
-        self.space.step(1/constants.FPS)
-
-        # Update the position of the sensor
-        self.sensor.update_position(self.body.position, self.body.angle)
     
     def move_to(self, target_pos):
         target_delta = target_pos - self.body.position
@@ -75,11 +104,6 @@ class SRobot:
             dv = Vec2d(10 * direction, 0.0)
             self.body.velocity = self.body.rotation_vector.cpvrotate(dv)
 
-        self.space.step(1/constants.FPS)
-
-        # Update the position of the sensor
-        self.sensor.update_position(self.body.position, self.body.angle) 
-
     def rotate_to(self, angle, direction):
         """Rotate the robot to a given angle."""
 
@@ -91,11 +115,6 @@ class SRobot:
         else:
             self.body.angular_velocity = direction * math.pi/3
 
-        self.space.step(1/constants.FPS)
-
-        # Update the position of the sensor
-        self.sensor.update_position(self.body.position, self.body.angle)
-
     def __add_robot_body(self, space, position, start_angle):
         """Create and add to the space a box shape for the robot body.
         
@@ -116,19 +135,27 @@ class SRobot:
         # Add the body to the space
         space.add(body, shape)
 
+        # Save the shape, so that the sensor can ignore it
+        self.shape = shape
+
         return body
     
     def __custom_vel_func(self, body, gravity, damping, dt):
         new_damping = 1.00
         pymunk.Body.update_velocity(body, gravity, damping, dt)
     
-    def get_velocities(self, target_pos):
+    def get_flc_inputs(self, target_pos):
         """
         Returns:
-            (float, float): Returns translational and roational velocities (in
-            this order) once they are computed by the FLC.
+            (float, float, float, float, float): The inputs of the FLC, which 
+            are the minimum distances read by the sensor in the left, front and
+            right zones, and the angle and the distance to the target.
         """
 
+        # Update the position of the sensor, since the robot moved since the
+        # last reading
+        self.sensor.update_position(self.body.position, self.body.angle)
+
         distances = self.sensor.get_reading()
         n = len(distances)
 
@@ -153,6 +180,22 @@ class SRobot:
         # Normalize the angle 
         angle_to_goal = self.__normalize_angle(angle_to_goal)
 
+        # The message is only built if it is logged, since this runs for every
+        # robot on every step
+        if self.logger.isEnabledFor(log.LOG_DEBUG):
+            self.logger.debug(f'Readings for the FLC: {[left_dist, front_dist, right_dist, angle_to_goal, dist]}')
+
+        return left_dist, front_dist, right_dist, angle_to_goal, dist
+    
+    def get_velocities(self, target_pos):
+        """
+        Returns:
+            (float, float): Returns translational and roational velocities (in
+            this order) once they are computed by the FLC.
+        """
+
+        left_dist, front_dist, right_dist, angle_to_goal, dist = self.get_flc_inputs(target_pos)
+
         # Save the new velocities
         vtras, vrot = self.flc.evaluate(inp_left=left_dist,
                                         inp_front=front_dist,
@@ -160,8 +203,8 @@ class SRobot:
                                         inp_ang=angle_to_goal,
                                         inp_dist=dist)
         
-        self.logger.debug(f'Readings for the FLC: {[left_dist, front_dist, right_dist, angle_to_goal, dist]}')
-        self.logger.debug(f'New velocities: vtras = {vtras}, vrot = {vrot}')
+        if self.logger.isEnabledFor(log.LOG_DEBUG):
+            self.logger.debug(f'New velocities: vtras = {vtras}, vrot = {vrot}')
 
         return vtras, vrot
     
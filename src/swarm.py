@@ -1,5 +1,7 @@
 import math
-import time 
+import time
+
+import numpy as np
 
 from enum import Enum
 
@@ -8,6 +10,7 @@ import log
 import constants
 
 from srobot import SRobot
+from fuzzy import shared_fuzzy_system
 
 
 class SwarmState(Enum):
@@ -35,16 +38,52 @@ class SwarmController:
 
     SWARM_RADIUS = 23  # in cm
 
+    # The number of physics steps the robots keep their velocity for when the
+    # swarm is given the action to move
+    TRANSLATION_TICKS = 3
+
+    # The number of physics steps after which the swarm is considered stuck 
+    # while its robots move to their new positions in the formation (5 seconds
+    # of simulated time)
+    STUCK_TICKS = 5 * constants.FPS
+
+    # The default maximum number of physics steps (sub-steps) an action can 
+    # take before it is aborted
+    MAX_SUBSTEPS = 10 * constants.FPS
+
     # Create and save the logger for this class
     logger = log.create_logger(name="Swarm",
                                level=log.LOG_INFO)
 
-    def __init__(self, start_pos, start_angle, sim_space, goal_pos, target, *, swarm_size=SWARM_SIZE):
+    def __init__(self, start_pos, start_angle, sim_space, goal_pos, target, *, 
+                 swarm_size=SWARM_SIZE, sensor_config=None, flc=None,
+                 max_substeps=MAX_SUBSTEPS, rng=None, instrumentation=None):
+        """
+        Args:
+            max_substeps (int, optional): The maximum number of sub-steps (see
+            `run`) an action can take, after which the action is aborted and
+            the swarm accepts a new one. If None, the actions are not bounded.
+            Defaults to `SwarmController.MAX_SUBSTEPS`.
+
+            rng (numpy.random.SeedSequence or int, optional): The seed of the 
+            sensor noise, from which an independent stream is spawned for every
+            robot. If None, fresh entropy is taken from the OS.
+
+            instrumentation (Instrumentation, optional): If given, the sensor
+            scans and the evaluations of the FLC are timed.
+        """
+
         self.space = sim_space
         self.goal_pos = goal_pos
         self.target = target
 
         self.swarm_size = swarm_size
+        self.sensor_config = sensor_config
+        self.max_substeps = max_substeps
+        self.instr = instrumentation
+
+        # The fuzzy controller shared by all of the robots in the swarm
+        self.flc = flc if flc is not None else shared_fuzzy_system()
         self.position = start_pos
         self.angle = start_angle  # in radians
         self.f_sca = self.SWARM_RADIUS  # in cm
@@ -53,7 +92,10 @@ class SwarmController:
         self.b_angle = (2 * math.pi - self.U_SHAPE_ALPHA) / (swarm_size - 1)
 
         # Add the robots in the swarm and place them in a U shape
-        self.robots = self.__add_robots()
+        if not isinstance(rng, np.random.SeedSequence):
+            rng = np.random.SeedSequence(rng)
+
+        self.robots = self.__add_robots(rng.spawn(swarm_size))
 
         self.r_target_pos = None
         self.r_dir = None
@@ -61,22 +103,38 @@ class SwarmController:
 
         # Upon initialization, the swarm isn't performing any action
         self.state = SwarmState.NONE
-        self.state_start = time.time()
         self.state_count = 0
+
+        # The number of sub-steps the current action took, and the sub-step
+        # the current state started at
+        self.substeps = 0
+        self.state_start = 0
         self.last_state = SwarmState.NONE
 
+        # The number of physics steps the current translation already took
+        self.translation_ticks = 0
+
         # At first, the task is to get the swarm to go to the object
         self.task = constants.TASK_TO_FOOD
 
-    def run(self, action=None):
+    def run(self, action=None, avg_vel=None):
         """The main body that drives the swarm. Can give an optional argument 
         which denotes the action to take (move the swarm linearly, rotate the
         swarm or scale it). If the swarm is already processing an action it will
         continue to do so until it is completed.
+
+        While an action is processed, every call is a sub-step which should be
+        followed by exactly one physics step. The time limits of the states are
+        measured in sub-steps, so they do not depend on the speed of the host.
         
         Args:
             action (int): Can be one of the three options: 0 = tras, 1 = rot, 
             3 = sca or None (in which case the argument can be skipped).
+
+            avg_vel ((float, float), optional): The average vtras and vrot of 
+            the robots, if they were already computed for a new action (e.g. 
+            together with the ones of other swarms). By default they are 
+            computed with `get_avg_vel`.
         """
         
         assert (action in [0, 1, 2] or action is None), \
@@ -88,18 +146,29 @@ class SwarmController:
             self.logger.info("The swarm is already running a different action")
             return
         
-        self.logger.debug(f"State is [{self.state}]")
-        self.logger.debug(f"State count is {self.state_count}")
+        # The messages are only built if they are logged, since this runs on
+        # every sub-step
+        if self.logger.isEnabledFor(log.LOG_DEBUG):
+            self.logger.debug(f"State is [{self.state}]")
+            self.logger.debug(f"State count is {self.state_count}")
 
         if self.state_count > 150 and self.state == SwarmState.NONE and action is not None:
             action = 1 - action
 
+        if self.state != SwarmState.NONE:
+            self.substeps += 1
+
         # If the swarm is ready to accept commands  
         if self.state == SwarmState.NONE:
             # Get the velocities to be used for the robots in the swarm
-            self.vtras, self.vrot = self.get_avg_vel()
+            if avg_vel is None:
+                avg_vel = self.get_avg_vel()
+
+            self.vtras, self.vrot = avg_vel
+            self.substeps = 0
 
-            self.logger.debug(f'Vtras is {self.vtras} and vrot is {self.vrot}')
+            if self.logger.isEnabledFor(log.LOG_DEBUG):
+                self.logger.debug(f'Vtras is {self.vtras} and vrot is {self.vrot}')
 
             # Move the swarm
             if action == 0:
@@ -110,6 +179,7 @@ class SwarmController:
                     self.state_count += 1
 
                 self.state = SwarmState.TRANSLATION_INI
+                self.translation_ticks = 0
                 self.__reset_state_start()
 
             # Rotate the swarm
@@ -132,28 +202,32 @@ class SwarmController:
                     # Save the new position
                     self.r_target_pos.append(new_pos)
 
-                    # Stop the motion of the robot
-                    for i in range(self.swarm_size):
-                        self.robots[i].stop_move()
-                    
+                # Stop the motion of the robots
+                for i in range(self.swarm_size):
+                    self.robots[i].stop_move()
+
                 self.state = SwarmState.ROTATION_MOVE
                 self.__reset_state_start()
         
         elif self.state == SwarmState.TRANSLATION_INI:
             for i in range(self.swarm_size):
                 self.robots[i].move(self.vtras)
-            
-            # Update the position of the swarm
-            new_x = self.position[0] \
-                    + self.vtras * (self.swarm_size/constants.FPS) * math.cos(self.angle)
-            new_y = self.position[1] \
-                    + self.vtras * (self.swarm_size/constants.FPS) * math.sin(self.angle)
-            
-            self.position = new_x, new_y
 
-            # Movement finished
-            self.state = SwarmState.TRANSLATION_STOP
-            self.__reset_state_start()
+            self.translation_ticks += 1
+
+            # The robots keep moving until the last physics step of the 
+            # translation
+            if self.translation_ticks >= self.TRANSLATION_TICKS:
+                # Update the position of the swarm
+                duration = self.TRANSLATION_TICKS / constants.FPS
+                new_x = self.position[0] + self.vtras * duration * math.cos(self.angle)
+                new_y = self.position[1] + self.vtras * duration * math.sin(self.angle)
+                
+                self.position = new_x, new_y
+
+                # Movement finished
+                self.state = SwarmState.TRANSLATION_STOP
+                self.__reset_state_start()
         
         elif self.state == SwarmState.TRANSLATION_STOP:
             for i in range(self.swarm_size):
@@ -166,7 +240,7 @@ class SwarmController:
             finished_tras = 0
 
             # If the swarm got stuck for more than 5 seconds
-            if (time.time() - self.state_start) > 5:
+            if (self.substeps - self.state_start) > self.STUCK_TICKS:
                 self.__unstuck_swarm()
 
             # Move each robot to the new spot
@@ -204,6 +278,18 @@ class SwarmController:
 
             self.state = SwarmState.NONE
 
+        # Abort the action if it used its whole budget of sub-steps, so that 
+        # the physics step following this one is its last
+        if self.state != SwarmState.NONE and self.max_substeps is not None \
+                and self.substeps >= self.max_substeps:
+            if self.logger.isEnabledFor(log.LOG_DEBUG):
+                self.logger.debug(f"Action aborted after {self.substeps} sub-steps")
+
+            for i in range(self.swarm_size):
+                self.robots[i].stop_move()
+
+            self.__unstuck_swarm()
+
     def __unstuck_swarm(self):
         for i in range(self.swarm_size):
             self.robots[i].body.angle = self.angle
@@ -215,7 +301,7 @@ class SwarmController:
         self.state_count = 0
 
     def __reset_state_start(self):
-        self.state_start = time.time()
+        self.state_start = self.substeps
 
     def set_task(self, task):
         assert (task == constants.TASK_TO_FOOD or task == constants.TASK_TO_NEST), \
@@ -239,24 +325,55 @@ class SwarmController:
         
         return 0
 
-    def get_avg_vel(self):
+    def get_flc_inputs(self):
+        """
+        Returns:
+            numpy.ndarray: The inputs of the FLC, with one row for every robot
+            (see `SRobot.get_flc_inputs`).
+        """
+
+        target_pos = self.__get_target_pos()
+
+        return np.array([robot.get_flc_inputs(target_pos) for robot in self.robots])
+
+    def get_sensor_stats(self):
         """
+        Returns:
+            dict: The number of readings of the sensors of all of the robots 
+            that reused the last scan (hits) and that made a new one (misses),
+            and the share of the hits (see `LaserSensor.get_reading`).
+        """
+
+        hits = sum(robot.sensor.stats["hits"] for robot in self.robots)
+        misses = sum(robot.sensor.stats["misses"] for robot in self.robots)
+
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses > 0 else 0.0,
+        }
+
+    def get_avg_vel(self):
+        """The FLC is evaluated for all of the robots at once.
+
         Returns:
             (float, float): Average vrot and vtras for all robots.
         """
         
-        sum_vtras = 0
-        sum_vrot = 0
-        n = self.swarm_size
-        target_pos = self.__get_target_pos()
+        if self.instr is None:
+            vtras, vrot = self.flc.evaluate_batch(*self.get_flc_inputs().T)
+
+            return float(vtras.mean()), float(vrot.mean())
 
-        for i in range(n):
-            vtras, vrot = self.robots[i].get_velocities(target_pos)
+        start = time.perf_counter()
+        inputs = self.get_flc_inputs()
+        sensed = time.perf_counter()
+        vtras, vrot = self.flc.evaluate_batch(*inputs.T)
 
-            sum_vtras += vtras
-            sum_vrot += vrot
+        self.instr.add("sensing", sensed - start, count=self.swarm_size)
+        self.instr.add("flc", time.perf_counter() - sensed, count=self.swarm_size)
 
-        return sum_vtras/n, sum_vrot/n
+        return float(vtras.mean()), float(vrot.mean())
     
     def __get_target_pos(self):
         """Return the position of the current target, which based on the task 
@@ -297,9 +414,9 @@ class SwarmController:
         
         return x_new, y_new
 
-    def __add_robots(self):
+    def __add_robots(self, seeds):
         """Arrange the robots in a U shape around the starting position of the
-        swarm."""
+        swarm, giving each of them the seed of its sensor noise."""
         
         robots = []
         for i in range(self.swarm_size):
@@ -308,7 +425,10 @@ class SwarmController:
 
             robots.append(SRobot(space=self.space, 
                                  start_pos=pos,
-                                 start_angle=self.angle))
+                                 start_angle=self.angle,
+                                 sensor_config=self.sensor_config,
+                                 flc=self.flc,
+                                 rng=seeds[i]))
         
         return robots
     
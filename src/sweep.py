@@ -0,0 +1,287 @@
+"""Run the agents of `episodes.py` over a grid of parameters and seeds, with the
+jobs spread over a bounded pool of processes, each pinned to its own core.
+
+Every job is run headless and writes its metrics and its `result.json` in its
+own directory. The jobs that already have a `result.json` are skipped, so an
+interrupted sweep can be run again to finish it: the agents that are trained
+continue from their last checkpoint, and the other jobs start again from an
+empty directory. Once all of the jobs are done, their results are collected in
+`summary.csv`.
+
+Run from the `src` folder, e.g.
+
+    python sweep.py --agent sarsa dqn --swarm-size 3 4 5 --seeds 0 1 2
+"""
+
+import os
+import csv
+import json
+import time
+import shutil
+import argparse
+import itertools
+import multiprocessing as mp
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# Local imports
+import constants
+import log
+
+from metrics import read_metrics
+
+
+RESULT_FILE = "result.json"
+SUMMARY_FILE = "summary.csv"
+
+# The directory of the checkpoints of a job, within its own directory
+CHECKPOINT_DIR = "checkpoints"
+
+# The share of the last episodes of a run whose rewards are averaged in the
+# summary
+FINAL_EPISODES = 0.1
+
+# The parameters of the grid that an agent does not use, which are left out of
+# its jobs
+UNUSED_PARAMETERS = {
+    "random": ("learning_rate",),
+}
+
+logger = log.create_logger(name="Sweep",
+                           level=log.LOG_INFO)
+
+
+def expand_grid(grid, seeds):
+    """Return the jobs for all of the combinations of the parameters and seeds.
+    The parameters an agent does not use (see `UNUSED_PARAMETERS`) are left out
+    of its jobs, so that it is only run once for all of their values.
+
+    Args:
+        grid (dict): For every parameter, the list of its values.
+        seeds (list): The seeds every combination is run with.
+
+    Returns:
+        list: For every job, a dict of its parameters, including its seed.
+    """
+
+    names = list(grid)
+
+    jobs = {}
+    for values in itertools.product(*grid.values()):
+        for seed in seeds:
+            job = dict(zip(names, values)) | {"seed": seed}
+
+            for name in UNUSED_PARAMETERS.get(job.get("agent"), ()):
+                job.pop(name, None)
+
+            jobs.setdefault(get_job_name(job), job)
+
+    return list(jobs.values())
+
+
+def get_job_name(job):
+    """Return the name of the directory of a job, made of its parameters."""
+
+    return "_".join(f"{name}={value}" for name, value in job.items())
+
+
+def _pin_worker(cores):
+    """Initializer of the worker processes, which pins every worker to one of
+    the free cores."""
+
+    core = cores.get()
+
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {core})
+
+
+def run_job(job, job_dir, nb_steps):
+    """Run a single job and write its result in its directory.
+
+    Returns:
+        dict: The parameters of the job and the summary of its metrics.
+    """
+
+    # The agents are only imported by the workers, since importing keras
+    # takes a while
+    import episodes
+
+    agent = job["agent"]
+    checkpoint_dir = os.path.join(job_dir, CHECKPOINT_DIR)
+
+    # A job that was interrupted is resumed from its last checkpoint. If it has
+    # none, what it left is removed, so that its metrics are not mixed with the
+    # ones of the new run
+    resume = False
+    if agent != "random":
+        from checkpoint import latest_checkpoint
+
+        resume = latest_checkpoint(checkpoint_dir) is not None
+
+    if not resume:
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    os.makedirs(job_dir, exist_ok=True)
+    sim_kwargs = {
+        "headless": True,
+        "swarm_size": job["swarm_size"],
+        "sensor_params": {"n_readings": job["n_readings"]},
+    }
+
+    start = time.perf_counter()
+
+    if agent == "random":
+        metrics_file = episodes.run_random(max_steps=nb_steps,
+                                           max_episode_steps=job["max_ep_steps"],
+                                           seed=job["seed"],
+                                           sim_kwargs=sim_kwargs,
+                                           output_dir=job_dir)
+    else:
+        run = episodes.run_episodes_sarsa if agent == "sarsa" else episodes.run_episodes_dqn
+        metrics_file = run(nb_steps=nb_steps,
+                           learning_rate=job["learning_rate"],
+                           max_episode_steps=job["max_ep_steps"],
+                           seed=job["seed"],
+                           sim_kwargs=sim_kwargs,
+                           output_dir=job_dir,
+                           models_dir=job_dir,
+                           checkpoint_dir=checkpoint_dir,
+                           resume=resume)
+
+    duration = time.perf_counter() - start
+
+    metrics = read_metrics(metrics_file)
+    rewards = np.array(metrics.get("episode_reward", []), dtype=float)
+    steps = np.array(metrics.get("nb_episode_steps", []), dtype=float)
+    n_final = max(int(len(rewards) * FINAL_EPISODES), 1)
+
+    result = job | {
+        "episodes": len(rewards),
+        "mean_reward": float(rewards.mean()) if len(rewards) else None,
+        "final_reward": float(rewards[-n_final:].mean()) if len(rewards) else None,
+        "mean_episode_steps": float(steps.mean()) if len(steps) else None,
+        "duration": duration,
+        "metrics_file": os.path.basename(metrics_file),
+    }
+
+    # The result is written last and at once, since its presence marks the
+    # job as finished
+    result_file = os.path.join(job_dir, RESULT_FILE)
+    with open(result_file + ".tmp", "w") as f:
+        json.dump(result, f, indent=2)
+
+    os.replace(result_file + ".tmp", result_file)
+
+    # The checkpoints are not needed once the job is finished
+    shutil.rmtree(checkpoint_dir, ignore_errors=True)
+
+    return result
+
+
+def run_sweep(jobs, out_dir, nb_steps, max_workers=None):
+    """Run the jobs that are not finished yet, and write the summary of all of
+    them.
+
+    Args:
+        jobs (list): The jobs (see `expand_grid`).
+        out_dir (str): The directory of the sweep.
+        nb_steps (int): The number of steps of every job.
+
+        max_workers (int, optional): The maximum number of jobs run at once. It
+        is bounded by the number of cores available. Defaults to all of them.
+
+    Returns:
+        list: The results of the finished jobs.
+    """
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    pending = [job for job in jobs
+               if not os.path.exists(os.path.join(out_dir, get_job_name(job), RESULT_FILE))]
+    logger.info(f"{len(jobs) - len(pending)} of {len(jobs)} jobs already finished")
+
+    if pending:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") \
+                else list(range(os.cpu_count()))
+        n_workers = min(max_workers or len(cores), len(cores), len(pending))
+
+        # Every worker takes one of the cores when it starts
+        ctx = mp.get_context("spawn")
+        free_cores = ctx.Queue()
+        for core in cores[:n_workers]:
+            free_cores.put(core)
+
+        with ProcessPoolExecutor(max_workers=n_workers, mp_context=ctx,
+                                 initializer=_pin_worker, initargs=(free_cores,)) as pool:
+            futures = {pool.submit(run_job, job, os.path.join(out_dir, get_job_name(job)), nb_steps): job
+                       for job in pending}
+
+            for future in as_completed(futures):
+                job = futures[future]
+
+                try:
+                    future.result()
+                    logger.info(f"Finished {get_job_name(job)}")
+                except Exception as e:
+                    logger.error(f"Job {get_job_name(job)} failed: {e!r}")
+
+    return write_summary(jobs, out_dir)
+
+
+def write_summary(jobs, out_dir):
+    """Collect the results of the finished jobs in a CSV file."""
+
+    results = []
+    for job in jobs:
+        result_file = os.path.join(out_dir, get_job_name(job), RESULT_FILE)
+
+        if os.path.exists(result_file):
+            with open(result_file) as f:
+                results.append(json.load(f))
+
+    if results:
+        fields = list(dict.fromkeys(key for result in results for key in result))
+
+        with open(os.path.join(out_dir, SUMMARY_FILE), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(results)
+
+    logger.info(f"{len(results)} results written to {os.path.join(out_dir, SUMMARY_FILE)}")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agent", nargs="+", default=["sarsa"],
+                        choices=["sarsa", "dqn", "random"])
+    parser.add_argument("--swarm-size", type=int, nargs="+", default=[constants.ROBOTS_NUMBER])
+    parser.add_argument("--max-ep-steps", type=int, nargs="+", default=[constants.MAX_EP_STEPS])
+    parser.add_argument("--learning-rate", type=float, nargs="+", default=[3e-4])
+    parser.add_argument("--n-readings", type=int, nargs="+", default=[32])
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--nb-steps", type=int, default=200000,
+                        help="The number of steps of every job")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="The maximum number of jobs run at once")
+    parser.add_argument("--out", default="data/sweeps/sweep",
+                        help="The directory of the sweep")
+    args = parser.parse_args()
+
+    grid = {
+        "agent": args.agent,
+        "swarm_size": args.swarm_size,
+        "max_ep_steps": args.max_ep_steps,
+        "learning_rate": args.learning_rate,
+        "n_readings": args.n_readings,
+    }
+
+    run_sweep(expand_grid(grid, args.seeds), args.out, args.nb_steps, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""Tests of the simulation and of the tools around it. They are run from the
+`src` folder, with
+
+    python -m pytest tests
+"""
@@ -0,0 +1,40 @@
+import os
+import glob
+import json
+
+# Local imports
+import sweep
+
+from metrics import read_metrics
+
+
+JOB = {
+    "agent": "random",
+    "swarm_size": 3,
+    "max_ep_steps": 10,
+    "n_readings": 13,
+    "seed": 0,
+}
+
+
+def test_rerun_interrupted_job(tmp_path):
+    job_dir = os.path.join(tmp_path, sweep.get_job_name(JOB))
+    os.makedirs(job_dir)
+
+    # An interrupted run leaves its metrics, but no result
+    stale_file = os.path.join(job_dir, "rnd_data2000-01-01 00:00:00.jsonl")
+    with open(stale_file, "w") as f:
+        for episode in range(3):
+            f.write(json.dumps({"episode": episode, "episode_reward": -1.0,
+                                "nb_episode_steps": 10}) + "\n")
+
+    result = sweep.run_job(JOB, job_dir, nb_steps=40)
+
+    # Only the metrics of the new run are left and summarized
+    metrics_files = glob.glob(os.path.join(job_dir, "*.jsonl"))
+    assert [os.path.basename(path) for path in metrics_files] == [result["metrics_file"]]
+    assert read_metrics(metrics_files[0])["episode"] == [0, 1, 2, 3]
+    assert result["episodes"] == 4
+
+    with open(os.path.join(job_dir, sweep.RESULT_FILE)) as f:
+        assert json.load(f) == result
@@ -0,0 +1,136 @@
+import numpy as np
+
+# Local imports
+import constants
+
+from sim import Simulation
+
+
+class VecSimulation:
+    """Many independent arenas, each with its own space, swarm, target and nest,
+    that are stepped together.
+
+    The arenas are headless and use the raycast sensor backend, since they can
+    not share a single rendered screen. The fuzzy controller is evaluated for
+    the robots of all the arenas at once.
+    """
+
+    OBSERVATION_SPACE_N = Simulation.OBSERVATION_SPACE_N
+    ACTION_SPACE_N = Simulation.ACTION_SPACE_N
+
+    def __init__(self, n_envs, *, max_episode_steps=constants.MAX_EP_STEPS, 
+                 seed=None, **sim_kwargs):
+        """Initialize all of the arenas.
+
+        Args:
+            n_envs (int): The number of arenas.
+
+            max_episode_steps (int, optional): The maximum number of steps of an
+            episode, after which the arena is reset. If None, an arena is only
+            reset once the target arrived in the nest. Defaults to 
+            constants.MAX_EP_STEPS.
+
+            seed (int, optional): The seed from which a different seed is
+            derived for every arena (see `Simulation.seed`). Defaults to None.
+
+            sim_kwargs: Other arguments given to every `Simulation`. The arenas
+            are always headless and use the raycast backend.
+        """
+
+        sim_kwargs = {"headless": True, "sensor_backend": "raycast"} | sim_kwargs
+
+        assert sim_kwargs["headless"] and sim_kwargs["sensor_backend"] == "raycast", \
+                "[VecSimulation] The arenas have to be headless and use the raycast sensor backend"
+
+        self.n_envs = n_envs
+        self.max_episode_steps = max_episode_steps
+
+        seeds = np.random.SeedSequence(seed).generate_state(n_envs)
+        self.sims = [Simulation(seed=int(seeds[i]), **sim_kwargs)
+                     for i in range(n_envs)]
+        
+        # All of the arenas use the same fuzzy controller
+        self.flc = self.sims[0].flc
+
+        self.episode_steps = np.zeros(n_envs, dtype=int)
+
+    def reset(self):
+        """Reset all of the arenas.
+        
+        Returns:
+            numpy.ndarray: The observations, with one row for every arena.
+        """
+
+        self.episode_steps[:] = 0
+
+        return np.array([sim.reset() for sim in self.sims], dtype=float)
+
+    def step(self, actions):
+        """Advance all of the arenas one step. An arena whose episode is done
+        is reset, and the observation returned for it is the first one of the
+        new episode, while the last one is saved in its info dict as 
+        `"terminal_observation"`.
+
+        Args:
+            actions (numpy.ndarray): The action for every arena.
+
+        Returns:
+            (numpy.ndarray, numpy.ndarray, numpy.ndarray, list): The 
+            observations, the rewards, the done flags and the info dicts of all
+            the arenas.
+        """
+
+        assert len(actions) == self.n_envs, \
+                "[VecSimulation.step] There has to be an action for every arena"
+
+        avg_vels = self.__get_avg_vels()
+
+        observations = np.empty((self.n_envs, self.OBSERVATION_SPACE_N))
+        rewards = np.empty(self.n_envs)
+        dones = np.empty(self.n_envs, dtype=bool)
+        infos = []
+
+        for i, (sim, action) in enumerate(zip(self.sims, actions)):
+            observation, reward, done, info = sim.step(int(action), avg_vel=avg_vels[i])
+            self.episode_steps[i] += 1
+
+            # The episode is also finished if it took too many steps
+            if self.max_episode_steps is not None and self.episode_steps[i] >= self.max_episode_steps:
+                info["TimeLimit.truncated"] = not done
+                done = True
+
+            if done:
+                info["terminal_observation"] = np.array(observation, dtype=float)
+                observation = sim.reset()
+                self.episode_steps[i] = 0
+
+            observations[i] = observation
+            rewards[i] = reward
+            dones[i] = done
+            infos.append(info)
+
+        return observations, rewards, dones, infos
+
+    def __get_avg_vels(self):
+        """Evaluate the fuzzy controller for the robots of all of the arenas at
+        once.
+
+        Returns:
+            list: The average vtras and vrot of the robots of every arena.
+        """
+
+        inputs = [sim.swarm.get_flc_inputs() for sim in self.sims]
+        vtras, vrot = self.flc.evaluate_batch(*np.concatenate(inputs).T)
+
+        # Average the velocities over the robots of every arena
+        counts = np.array([len(inp) for inp in inputs])
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        avg_vtras = np.add.reduceat(vtras, starts) / counts
+        avg_vrot = np.add.reduceat(vrot, starts) / counts
+
+        return list(zip(avg_vtras.tolist(), avg_vrot.tolist()))
+
+    def close(self):
+        for sim in self.sims:
+            sim.close()